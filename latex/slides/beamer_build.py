@@ -0,0 +1,527 @@
+"""
+Compile and rasterise the example slides of the Beamer theme galleries.
+
+Each gallery entry is a folder that gets an `Example.tex` file, a PDF of it
+and a PNG of each page. The folders are built on a pool of worker threads
+(each of which runs `pdflatex` as a subprocess in the folder, so the
+process's own working directory never changes) and any failures are reported
+at the end.
+
+The PDFs are rendered to images in memory with PyMuPDF on a pool of
+long-lived worker processes. An image file is only rewritten if its pixels
+have changed. If PyMuPDF is not installed, `pdftoppm` is used instead.
+
+A manifest records a hash of the inputs of each folder's slides: the LaTeX
+source, the themes, the resolution and the versions of the tools. Only the
+folders whose hash has changed are rebuilt.
+
+Loading the document class and packages takes up most of each LaTeX run, so
+by default they are loaded once and dumped into a format file (using the
+mylatexformat package) that every deck with the same preamble is compiled
+with. The auxiliary files of each deck are kept between builds and LaTeX is
+only re-run when they change.
+"""
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, \
+    FIRST_COMPLETED, wait
+from pathlib import Path
+import hashlib
+import importlib.util
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+MANIFEST = 'build_manifest.json'
+# Where the precompiled preambles are kept (in the gallery's folder)
+FORMAT_DIR = '.beamer_formats'
+# Where each deck's auxiliary files are kept between builds
+AUX_DIR = '.aux'
+# The auxiliary files that, if they change, mean LaTeX needs to be re-run
+AUX_EXTENSIONS = ('.aux', '.nav', '.out', '.snm', '.toc')
+MAX_PASSES = 3
+# The resolution that pdftoppm uses by default
+DEFAULT_DPI = 150
+# The hashes of the pixels of each image, kept alongside the auxiliary files
+PIXELS = 'pixels.json'
+
+
+def run(command, folder):
+    """Run a command in a folder, raising an error if it fails."""
+    try:
+        result = subprocess.run(
+            command, cwd=folder, stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE, text=True
+        )
+    except OSError as error:
+        # Eg the command is not installed
+        message = f'{command[0]} could not be run: {error}'
+        raise RuntimeError(message) from error
+    if result.returncode != 0:
+        message = f'{command[0]} exited with status {result.returncode}'
+        if result.stderr:
+            message += ': ' + result.stderr.strip().splitlines()[-1]
+        raise RuntimeError(message)
+
+
+def get_tool_versions():
+    """Get the first line of the version information of each tool."""
+    versions = {}
+    if importlib.util.find_spec('pymupdf') is not None:
+        import pymupdf
+        versions['pymupdf'] = pymupdf.VersionBind
+    for command in [['pdflatex', '--version'], ['pdftoppm', '-v']]:
+        try:
+            result = subprocess.run(command, capture_output=True, text=True)
+        except FileNotFoundError:
+            versions[command[0]] = None
+            continue
+        # pdftoppm prints its version to stderr
+        output = (result.stdout or result.stderr).strip().splitlines()
+        versions[command[0]] = output[0] if output else ''
+
+    return versions
+
+
+def get_cache_key(tex, themes, raster, versions):
+    """Hash everything that affects what a folder's slides look like."""
+    inputs = json.dumps([tex, list(themes), raster, versions], sort_keys=True)
+    return hashlib.sha256(inputs.encode()).hexdigest()
+
+
+def get_preamble(tex):
+    """Get the document class and packages of some LaTeX code."""
+    lines = tex.splitlines()
+    preamble = [lines[0]]
+    for line in lines[1:]:
+        if line.startswith(r'\begin{document}'):
+            break
+        if line.startswith(r'\usepackage'):
+            preamble.append(line)
+    return '\n'.join(preamble) + '\n'
+
+
+def make_format(preamble, versions, folder='.'):
+    """
+    Dump a preamble into a format file in a gallery's folder, unless it has
+    been done already.
+
+    Returns the path to the format (without its extension).
+    """
+    key = get_cache_key(preamble, [], [], versions)
+    name = f'beamer-{key[:12]}'
+    format_dir = Path(folder, FORMAT_DIR)
+    fmt = Path(format_dir, name).resolve()
+    if fmt.with_suffix('.fmt').exists():
+        return fmt
+    format_dir.mkdir(exist_ok=True)
+    with open(Path(format_dir, f'{name}.tex'), 'w') as file:
+        file.write(preamble)
+        file.write(r'\endofdump' + '\n')
+    command = [
+        'pdftex', '-ini', '-interaction=batchmode', f'-jobname={name}',
+        '&pdflatex', 'mylatexformat.ltx', f'{name}.tex'
+    ]
+    run(command, format_dir)
+    return fmt
+
+
+def is_built(folder, extension='png'):
+    """Check if a folder has a PDF and an image of its last page."""
+    return Path(folder, 'Example.pdf').exists() and \
+        Path(folder, f'Example-4.{extension}').exists()
+
+
+def read_aux_files(folder):
+    """Get the contents of the auxiliary files in a folder."""
+    contents = {}
+    for extension in AUX_EXTENSIONS:
+        path = Path(folder, 'Example' + extension)
+        if path.exists():
+            contents[extension] = path.read_bytes()
+    return contents
+
+
+def compile_slides(folder, tex, fmt=None):
+    """
+    Run LaTeX until the auxiliary files stop changing.
+
+    Returns the number of times LaTeX was run.
+    """
+    aux_dir = Path(folder, AUX_DIR)
+    # Start from the auxiliary files of the last build
+    for extension in AUX_EXTENSIONS:
+        path = Path(aux_dir, 'Example' + extension)
+        if path.exists():
+            shutil.copy2(path, folder)
+    pdflatex = ['pdflatex', '-interaction=batchmode']
+    if fmt is None:
+        pdflatex.append('Example.tex')
+    else:
+        # Skip the part of the preamble that is in the format
+        lines = tex.split('\n', 1)
+        with open(Path(folder, 'Example-fmt.tex'), 'w') as file:
+            file.write(lines[0] + '\n')
+            file.write(r'\csname endofdump\endcsname' + '\n')
+            file.write(lines[1])
+        pdflatex += [f'-fmt={fmt}', '-jobname=Example', 'Example-fmt.tex']
+
+    try:
+        for passes in range(1, MAX_PASSES + 1):
+            before = read_aux_files(folder)
+            run(pdflatex, folder)
+            if read_aux_files(folder) == before:
+                break
+    except RuntimeError:
+        # Keep the log file so that the error can be investigated
+        Path(folder, 'Example.pdf').unlink(missing_ok=True)
+        raise
+
+    # Keep the auxiliary files for next time
+    aux_dir.mkdir(exist_ok=True)
+    for extension in AUX_EXTENSIONS:
+        path = Path(folder, 'Example' + extension)
+        if path.exists():
+            shutil.copy2(path, aux_dir)
+    # Delete intermediate files
+    Path(folder, 'Example-fmt.tex').unlink(missing_ok=True)
+    to_keep = ('.tex', '.pdf', '.png', '.jpg', '.webp')
+    for file in folder.iterdir():
+        if file.is_file() and not file.name.endswith(to_keep):
+            file.unlink()
+
+    return passes
+
+
+def render_pdf(folder, dpi=None, extension='png'):
+    """
+    Render each page of a folder's PDF to an image in memory with PyMuPDF.
+
+    The images are written in one pass over the document, skipping any whose
+    pixels are the same as those of the existing file. Returns the number of
+    pages.
+    """
+    import pymupdf
+
+    if dpi is None:
+        dpi = DEFAULT_DPI
+    hashes_path = Path(folder, AUX_DIR, PIXELS)
+    hashes = {}
+    if hashes_path.exists():
+        hashes = json.loads(hashes_path.read_text())
+    new_hashes = {}
+    with pymupdf.open(Path(folder, 'Example.pdf')) as document:
+        for number, page in enumerate(document, start=1):
+            pixmap = page.get_pixmap(dpi=dpi)
+            name = f'Example-{number}.{extension}'
+            digest = hashlib.sha256(pixmap.samples)
+            digest.update(f'{pixmap.width}x{pixmap.height}'.encode())
+            new_hashes[name] = digest.hexdigest()
+            path = Path(folder, name)
+            if path.exists() and hashes.get(name) == new_hashes[name]:
+                # The pixels are unchanged, so don't re-encode them
+                continue
+            path.write_bytes(pixmap.tobytes(extension))
+        pages = document.page_count
+    hashes_path.parent.mkdir(exist_ok=True)
+    hashes_path.write_text(json.dumps(new_hashes, indent=4))
+
+    return pages
+
+
+def run_pdftoppm(folder, dpi=None, extension='png'):
+    """Render each page of a folder's PDF to an image with pdftoppm."""
+    pdftoppm = ['pdftoppm', '-jpeg' if extension == 'jpg' else '-png']
+    if dpi is not None:
+        pdftoppm += ['-r', str(dpi)]
+    run(pdftoppm + ['Example.pdf', 'Example'], folder)
+
+
+class Rasteriser:
+    """
+    Render PDFs to images, in memory on long-lived worker processes.
+
+    `method` is 'pymupdf', 'pdftoppm' or 'auto' (PyMuPDF if it is installed,
+    otherwise pdftoppm).
+    """
+
+    def __init__(self, dpi=None, extension='png', method='auto', jobs=None):
+        if method == 'auto':
+            if importlib.util.find_spec('pymupdf') is not None:
+                method = 'pymupdf'
+            else:
+                method = 'pdftoppm'
+        self.method = method
+        self.dpi = dpi
+        self.extension = extension
+        self.jobs = jobs
+        self.executor = None
+
+    def settings(self):
+        """Get the settings that affect what the images look like."""
+        return [self.method, self.dpi, self.extension]
+
+    def __enter__(self):
+        if self.method == 'pymupdf':
+            # The workers are forked so that they don't re-run the script that
+            # is building the gallery
+            if 'fork' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('fork')
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.jobs, mp_context=context
+                )
+                # Fork every worker now, from the main thread: forking once
+                # the slides are being compiled on other threads could copy
+                # a lock that one of them holds (and deadlock)
+                self.executor.submit(int).result()
+            else:
+                self.executor = ThreadPoolExecutor(max_workers=self.jobs)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def __call__(self, folder):
+        """Render a folder's PDF to images and wait for it to finish."""
+        if self.executor is None:
+            run_pdftoppm(folder, self.dpi, self.extension)
+        else:
+            future = self.executor.submit(
+                render_pdf, folder, self.dpi, self.extension
+            )
+            future.result()
+
+
+def build_slides(folder, tex, rasterise, fmt=None):
+    """
+    Compile the LaTeX code in a folder and convert each page to an image.
+
+    Returns the time taken by each step and the number of LaTeX runs.
+    """
+    folder = Path(folder)
+    # Remove the out-of-date PDF. The images are kept so that any whose
+    # pixels have not changed do not need to be rewritten
+    Path(folder, 'Example.pdf').unlink(missing_ok=True)
+    # Export to TEX file
+    with open(Path(folder, 'Example.tex'), 'w') as file:
+        file.write(tex)
+
+    # Run LaTeX
+    start = time.perf_counter()
+    passes = compile_slides(folder, tex, fmt)
+    compile_time = time.perf_counter() - start
+
+    # Create the images
+    start = time.perf_counter()
+    rasterise(folder)
+    rasterise_time = time.perf_counter() - start
+
+    return {
+        'compile': compile_time,
+        'passes': passes,
+        'rasterise': rasterise_time,
+    }
+
+
+def make_thumbnails(folder, width, extension, pages=4, image='png'):
+    """Save a downsized copy of each slide's image, unless it is up to date."""
+    # Pillow is installed alongside Matplotlib
+    from PIL import Image
+
+    for page in range(1, pages + 1):
+        source = Path(folder, f'Example-{page}.{image}')
+        target = Path(folder, f'Example-{page}-thumb.{extension}')
+        if not source.exists():
+            continue
+        if target.exists() and \
+                target.stat().st_mtime_ns >= source.stat().st_mtime_ns:
+            continue
+        with Image.open(source) as picture:
+            height = round(picture.height * width / picture.width)
+            thumbnail = picture.resize((width, height), Image.LANCZOS)
+        thumbnail.save(target)
+
+
+def build_thumbnails(folders, width, extension, jobs=None, image='png'):
+    """Make the thumbnails of many folders' slides at once."""
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(
+                make_thumbnails, folder, width, extension, image=image
+            ): folder
+            for folder in folders
+        }
+    for future, folder in futures.items():
+        if future.exception() is not None:
+            print(f'Could not make thumbnails in {folder}: '
+                  f'{future.exception()}')
+
+
+def load_manifest(path=MANIFEST):
+    """Load the hashes of the slides that were built previously."""
+    if not Path(path).exists():
+        return {'slides': {}}
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_manifest(manifest, path=MANIFEST):
+    """Save the hashes of the slides that have been built."""
+    with open(path, 'w') as file:
+        json.dump(manifest, file, indent=4, sort_keys=True)
+
+
+def report_timings(timings, precompile):
+    """Print how long the slides took to build."""
+    if not timings:
+        return {}
+    n = len(timings)
+    summary = {
+        'decks': n,
+        'precompiled_preamble': precompile,
+        'compile_seconds': sum(t['compile'] for t in timings),
+        'rasterise_seconds': sum(t['rasterise'] for t in timings),
+        'latex_runs': sum(t['passes'] for t in timings),
+    }
+    mode = 'with' if precompile else 'without'
+    print(f'Timing ({mode} a precompiled preamble):')
+    print(
+        f'    LaTeX:    {summary["compile_seconds"] / n:.2f} s per deck, ' +
+        f'{summary["latex_runs"] / n:.2f} runs per deck'
+    )
+    print(f'    Images:   {summary["rasterise_seconds"] / n:.2f} s per deck')
+    return summary
+
+
+def build_gallery(
+    slides, dpi=None, jobs=None, manifest_path=None, precompile=True,
+    extension='png', rasteriser='auto', folder='.'
+):
+    """
+    Build the out-of-date slides of a gallery.
+
+    `slides` is a list of (folder, LaTeX code, themes) tuples. At most `jobs`
+    folders (by default, one per CPU) are built at a time and at most twice
+    that many are queued. The pages are saved as images with the given
+    resolution and extension ('png' or 'jpg') using the given rasteriser
+    (see `Rasteriser`). Returns a dictionary of the folders that could not be
+    built and why.
+
+    The manifest (by default) and the precompiled preambles are kept in the
+    gallery's `folder`.
+    """
+    if manifest_path is None:
+        manifest_path = Path(folder, MANIFEST)
+    manifest = load_manifest(manifest_path)
+    versions = get_tool_versions()
+    rasterise = Rasteriser(dpi, extension, rasteriser, jobs)
+
+    # Decide which slides are stale
+    stale = []
+    hits = 0
+    for slide_folder, tex, themes in slides:
+        key = get_cache_key(tex, themes, rasterise.settings(), versions)
+        previous = manifest['slides'].get(str(slide_folder))
+        if previous is None and is_built(slide_folder, extension):
+            # Adopt slides that were built before there was a manifest, as
+            # long as their LaTeX code is unchanged
+            tex_path = Path(slide_folder, 'Example.tex')
+            if tex_path.exists() and tex_path.read_text() == tex:
+                manifest['slides'][str(slide_folder)] = previous = key
+        if previous == key and is_built(slide_folder, extension):
+            hits += 1
+        else:
+            stale.append((slide_folder, tex, key))
+
+    # Dump each distinct preamble into a format file once
+    formats = {}
+    if precompile:
+        for preamble in {get_preamble(tex) for _, tex, _ in stale}:
+            try:
+                formats[preamble] = make_format(preamble, versions, folder)
+            except RuntimeError as error:
+                print(f'Could not precompile a preamble ({error})')
+                formats[preamble] = None
+
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    failures = {}
+    timings = []
+    done = 0
+    with ThreadPoolExecutor(max_workers=jobs) as executor, rasterise:
+        pending = {}
+        queue = iter(stale)
+        while True:
+            # Keep the queue topped up, but bounded
+            for slide_folder, tex, key in queue:
+                fmt = formats.get(get_preamble(tex))
+                future = executor.submit(
+                    build_slides, slide_folder, tex, rasterise, fmt
+                )
+                pending[future] = (slide_folder, key)
+                if len(pending) >= 2 * jobs:
+                    break
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                slide_folder, key = pending.pop(future)
+                done += 1
+                try:
+                    timings.append(future.result())
+                except Exception as error:
+                    failures[slide_folder] = error
+                    manifest['slides'].pop(str(slide_folder), None)
+                    print(f'[{done}/{len(stale)}] {slide_folder}: {error}')
+                else:
+                    manifest['slides'][str(slide_folder)] = key
+                    print(f'[{done}/{len(stale)}] {slide_folder}')
+
+    # Record how well the cache did and how long the build took
+    print(f'Build cache: {hits} hit(s), {len(stale)} miss(es)')
+    manifest['tool_versions'] = versions
+    manifest['last_run'] = {
+        'hits': hits,
+        'misses': len(stale),
+        'failures': len(failures),
+        'timing': report_timings(timings, precompile),
+    }
+    save_manifest(manifest, manifest_path)
+
+    return failures
+
+
+def report(failures):
+    """Print the folders that failed to build and exit with an error."""
+    if not failures:
+        return
+    print(f'\n{len(failures)} slide deck(s) failed to build:', file=sys.stderr)
+    for folder, error in failures.items():
+        print(f'    {folder}: {error}', file=sys.stderr)
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    # Build a small gallery and check that the precompiled preambles are
+    # kept at its root, not in the folder of one of its slides
+    tex = '\n'.join([
+        r'\documentclass{beamer}', r'\usetheme{Warsaw}',
+        r'\begin{document}', r'\begin{frame}Example\end{frame}',
+        r'\end{document}', ''
+    ])
+    with tempfile.TemporaryDirectory() as gallery:
+        slides = []
+        for name in ['Warsaw/default', 'Warsaw/wolverine']:
+            Path(gallery, name).mkdir(parents=True)
+            slides.append((Path(gallery, name), tex, ['Warsaw', name]))
+        failures = build_gallery(slides, folder=gallery)
+        assert Path(gallery, FORMAT_DIR).is_dir()
+        for slide_folder, _, _ in slides:
+            assert not Path(slide_folder, FORMAT_DIR).exists()
+        print(f'The formats are kept in the gallery\'s folder '
+              f'({len(failures)} deck(s) could not be built)')
@@ -1,11 +1,63 @@
 """Generate LaTeX slides."""
-import os
+import sys
+import argparse
 from pathlib import Path
 
-root_dir = os.path.dirname(os.path.abspath(__file__))
+# The slide-building code is shared with the other Beamer theme gallery
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from beamer_build import build_gallery, build_thumbnails, \
+    report  # noqa: E402
+from beamer_page import make_entry, write_page, write_split_pages, \
+    measure_page, knit, report_page, get_payload, \
+    report_payload  # noqa: E402
 
-# Export to RMD file
-rmd = open('themes.Rmd', 'w')
+# Create command-line argument parser
+parser = argparse.ArgumentParser()
+# Add optional arguments
+parser.add_argument(
+    '--jobs', '-j', type=int, default=None,
+    help='number of slide decks to build at once (default: one per CPU)'
+)
+parser.add_argument(
+    '--no_format', action='store_true',
+    help='load the preamble in every LaTeX run instead of precompiling it'
+)
+parser.add_argument(
+    '--shared_code', action='store_true',
+    help='show the code common to all slides once instead of in every tab'
+)
+parser.add_argument(
+    '--dpi', type=int, default=100,
+    help='resolution of the images of the slides (default: 100)'
+)
+parser.add_argument(
+    '--image_format', choices=['png', 'jpg'], default='png',
+    help='format of the images of the slides (default: png)'
+)
+parser.add_argument(
+    '--rasteriser', choices=['auto', 'pymupdf', 'pdftoppm'], default='auto',
+    help='how to make the images (default: PyMuPDF if installed)'
+)
+parser.add_argument(
+    '--thumbnails', choices=['webp', 'png', 'none'], default='webp',
+    help='format of the downsized images to show (default: webp)'
+)
+parser.add_argument(
+    '--thumbnail_width', type=int, default=400,
+    help='width of the downsized images in pixels (default: 400)'
+)
+parser.add_argument(
+    '--split', action='store_true',
+    help='write a separate page for each presentation theme'
+)
+parser.add_argument(
+    '--knit', action='store_true',
+    help='render the page to HTML and report how long it took'
+)
+# Parse arguments from terminal
+args = parser.parse_args()
+
+# The top of the RMD file
 rmd_content = """---
 title: '<font size="5">Slides in LaTeX:</font><br>Built-In Beamer Themes:<br><font size="5">Presentation and Colour Themes</font>'
 output:
@@ -45,7 +97,6 @@ See the package page on CTAN [here](https://ctan.org/pkg/beamer) and the full do
 **Presentation Themes:**
 
 """
-rmd.write(rmd_content)
 
 tex_content = r"""
 % Easy access to the Lorem Ipsum and other dummy texts
@@ -218,96 +269,67 @@ colours = [
 #     'tree',
 # ]
 
+# The names of the tab levels below the presentation themes
+labels = ['Colour Themes']
+# The slides on the page
+entries = []
 for theme in themes:
-    # Export to RMD file
-    rmd.write('## ' + theme + r' {.tabset}' + '\n')
-    rmd.write('**Colour Themes:**' + '\n')
-    rmd.write('\n')
-
     for colour in colours:
-        # Export to RMD file
-        rmd.write('### ' + colour + r' {.tabset}' + '\n')
-
         # Create folder
         folder = Path(theme, colour)
         print(folder)
         folder.mkdir(parents=True, exist_ok=True)
 
-        #
-        # Export to RMD file
-        #
-        # Images of slides
-        rmd.write(
-            f'<img src="{theme}/{colour}/Example-1.png" ' +
-            'style="width:49%; padding:4px; border:1px solid #000;">' + '\n'
-        )
-        rmd.write(
-            f'<img src="{theme}/{colour}/Example-2.png" ' +
-            'style="width:49%; padding:4px; border:1px solid #000;">' + '\n'
-        )
-        rmd.write(
-            f'<img src="{theme}/{colour}/Example-3.png" ' +
-            'style="width:49%; padding:4px; border:1px solid #000;">' + '\n'
-        )
-        rmd.write(
-            f'<img src="{theme}/{colour}/Example-4.png" ' +
-            'style="width:49%; padding:4px; border:1px solid #000;">' + '\n'
-        )
-        rmd.write('\n')
-        rmd.write('**Code to reproduce these slides:**' + '\n')
-        rmd.write('\n')
-        # LaTeX code snippets
-        rmd.write('```text' + '\n')
-        rmd.write(r'\documentclass{beamer}' + '\n')
-        rmd.write('\n')
-        rmd.write(r'\usetheme{%s}' % theme + '\n')
-        rmd.write(r'\usecolortheme{%s}' % colour + '\n')
-        rmd.write(r'\useinnertheme{default}' + '\n')
-        rmd.write(r'\useoutertheme{default}' + '\n')
-        rmd.write(r'\usefonttheme{default}' + '\n')
-        rmd.write(tex_content)
-        rmd.write('```' + '\n')
-        rmd.write('\n')
-        rmd.write('[⇦ Back](../../../latex.html)' + '\n')
-        rmd.write('\n')
-
-        # Check if folder contents already exists
-        if 'Example.tex' not in os.listdir(folder):
-            # Export to TEX file
-            filepath = Path(folder, 'Example.tex')
-            file = open(filepath, 'w')
-            file.write(r'\documentclass{beamer}' + '\n')
-            file.write('\n')
-            file.write(r'\usetheme{%s}' % theme + '\n')
-            file.write(r'\usecolortheme{%s}' % colour + '\n')
-            file.write(r'\useinnertheme{default}' + '\n')
-            file.write(r'\useoutertheme{default}' + '\n')
-            file.write(r'\usefonttheme{default}' + '\n')
-            file.write(tex_content)
-            file.close()
+        # The LaTeX code of the slides
+        tex = r'\documentclass{beamer}' + '\n'
+        tex += '\n'
+        tex += r'\usetheme{%s}' % theme + '\n'
+        tex += r'\usecolortheme{%s}' % colour + '\n'
+        tex += r'\useinnertheme{default}' + '\n'
+        tex += r'\useoutertheme{default}' + '\n'
+        tex += r'\usefonttheme{default}' + '\n'
+        tex += tex_content
 
-        # Check if folder contents already exists
-        if 'Example.pdf' not in os.listdir(folder):
-            # Run LaTeX
-            os.chdir(folder)
-            os.system('pdflatex -interaction=batchmode Example.tex')
-            # os.system('bibtex Example')
-            os.system('pdflatex -interaction=batchmode Example.tex')
-            # os.system('pdflatex Example.tex')
-            # Delete intermediate files
-            files = os.listdir()
-            to_keep = ('.tex', '.pdf')
-            for file in [f for f in files if not f.endswith(to_keep)]:
-                os.system('rm "{}"'.format(file))
-            os.chdir(root_dir)
+        # The presentation, colour, inner, outer and font themes
+        themes_used = (theme, colour, 'default', 'default', 'default')
+        entries.append(make_entry((theme, colour), themes_used, folder, tex))
 
-        # Check if folder contents already exists
-        if 'Example-4.png' not in os.listdir(folder):
-            # Create PNG image
-            os.chdir(folder)
-            os.system('pdftoppm -png -r 100 Example.pdf Example')
-            os.chdir(root_dir)
+# Export to RMD file(s)
+thumbnail = None if args.thumbnails == 'none' else args.thumbnails
+options = {
+    'shared_code': tex_content if args.shared_code else None,
+    'thumbnail': thumbnail,
+    'image': args.image_format,
+}
+if args.split:
+    pages = write_split_pages(
+        'themes.Rmd', rmd_content, labels, entries, **options
+    )
+else:
+    write_page('themes.Rmd', rmd_content, labels, entries, **options)
+    pages = [(Path('themes.Rmd'), entries)]
+paths = [path for path, _ in pages]
+full_size = None
+if args.shared_code:
+    full_size = measure_page(
+        rmd_content, labels, entries, thumbnail=thumbnail,
+        image=args.image_format
+    )
+knit_time = knit(paths) if args.knit else None
+report_page(paths, full_size, knit_time)
 
-rmd.write('</font>' + '\n')
-rmd.write('\n')
-rmd.close()
+# Compile the slides and create PNG images of them
+slides = [(e['folder'], e['tex'], e['themes']) for e in entries]
+failures = build_gallery(
+    slides, dpi=args.dpi, jobs=args.jobs, precompile=not args.no_format,
+    extension=args.image_format, rasteriser=args.rasteriser,
+    folder=Path(__file__).resolve().parent
+)
+if thumbnail is not None:
+    folders = [entry['folder'] for entry in entries]
+    build_thumbnails(
+        folders, args.thumbnail_width, thumbnail, args.jobs,
+        image=args.image_format
+    )
+report_payload(get_payload(pages, thumbnail, args.image_format))
+report(failures)
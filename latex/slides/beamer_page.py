@@ -0,0 +1,242 @@
+"""
+Write the R Markdown page of a Beamer theme gallery.
+
+The gallery is described as data: a list of entries, each with the names of
+the tabs it sits in (eg its presentation theme and colour theme), all five of
+the themes it uses, the folder containing its images and its LaTeX code. The
+page is rendered from templates and streamed to the file one tab at a time.
+
+The images can be shown as downsized, lazily-loaded thumbnails (that link to
+the full-size images) and the gallery can be split into one page per
+first-level tab so that browsers do not download every image at once.
+"""
+from pathlib import Path
+from string import Template
+import shutil
+import subprocess
+import time
+
+# Write to the file in large blocks
+BUFFER_SIZE = 1024 * 1024
+
+HEADING = Template('$hashes $name {.tabset}\n')
+SUBHEADING = Template('**$label:**\n\n')
+# The number of slides in each set
+PAGES = 4
+IMAGE = Template(
+    '<img src="$folder/Example-$page.$image" '
+    'style="width:49%; padding:4px; border:1px solid #000;">\n'
+)
+THUMBNAIL = Template(
+    '<a href="$folder/Example-$page.$image">'
+    '<img src="$folder/Example-$page-thumb.$extension" loading="lazy" '
+    'style="width:49%; padding:4px; border:1px solid #000;"></a>\n'
+)
+NAVIGATION = Template('- [$name]($href)\n')
+CODE = Template(
+    '\n'
+    '**Code to reproduce these slides:**\n'
+    '\n'
+    '```text\n'
+    '$code'
+    '```\n'
+    '\n'
+    '[⇦ Back](../../../latex.html)\n'
+    '\n'
+)
+SHARED_CODE_NOTE = '% ...followed by the code shared by all slides (below)\n'
+SHARED_CODE = Template(
+    'Code Shared by All Slides {#shared-code}\n'
+    '=======================================\n'
+    '\n'
+    '```text\n'
+    '$code'
+    '```\n'
+    '\n'
+)
+FOOTER = '</font>\n\n'
+
+
+def make_entry(tabs, themes, folder, tex):
+    """Describe one set of slides in the gallery."""
+    return {
+        'tabs': tuple(tabs),
+        'themes': tuple(themes),
+        'folder': Path(folder),
+        'tex': tex,
+    }
+
+
+def get_image_paths(entry, thumbnail=None, image='png'):
+    """Get the paths of the images of a set of slides that a page shows."""
+    paths = []
+    for page in range(1, PAGES + 1):
+        if thumbnail is None:
+            paths.append(Path(entry['folder'], f'Example-{page}.{image}'))
+        else:
+            name = f'Example-{page}-thumb.{thumbnail}'
+            paths.append(Path(entry['folder'], name))
+    return paths
+
+
+def render_entry(entry, shared_code=None, thumbnail=None, image='png'):
+    """Render the images and code of one set of slides."""
+    folder = entry['folder'].as_posix()
+    for page in range(1, PAGES + 1):
+        if thumbnail is None:
+            yield IMAGE.substitute(folder=folder, page=page, image=image)
+        else:
+            yield THUMBNAIL.substitute(
+                folder=folder, page=page, image=image, extension=thumbnail
+            )
+    code = entry['tex']
+    if shared_code is not None and code.endswith(shared_code):
+        # Only show the lines that are particular to these slides
+        code = code[:-len(shared_code)] + SHARED_CODE_NOTE
+    yield CODE.substitute(code=code)
+
+
+def render_page(
+    header, labels, entries, shared_code=None, thumbnail=None, image='png',
+    links=None
+):
+    """
+    Render the page, one piece at a time.
+
+    `labels` are the names of the tab levels below the first one (eg
+    ['Colour Themes']). `image` is the file extension of the full-size images
+    and `thumbnail` is that of the thumbnails to show instead of them.
+    `links` is a list of (name, href) pairs of pages to link to at the top of
+    this one.
+    """
+    yield header
+    if links:
+        for name, href in links:
+            yield NAVIGATION.substitute(name=name, href=href)
+        yield '\n'
+    previous = ()
+    for entry in entries:
+        tabs = entry['tabs']
+        # Open a new tab at each level whose name has changed
+        for level, name in enumerate(tabs):
+            if tabs[:level + 1] == previous[:level + 1]:
+                continue
+            yield HEADING.substitute(hashes='#' * (level + 2), name=name)
+            if level < len(labels):
+                yield SUBHEADING.substitute(label=labels[level])
+        previous = tabs
+        yield from render_entry(entry, shared_code, thumbnail, image)
+    if shared_code is not None:
+        yield SHARED_CODE.substitute(code=shared_code)
+    yield FOOTER
+
+
+def write_page(path, header, labels, entries, **options):
+    """
+    Stream the rendered page to a file and return its size in bytes.
+
+    The options are those of `render_page`.
+    """
+    with open(path, 'w', buffering=BUFFER_SIZE) as file:
+        for chunk in render_page(header, labels, entries, **options):
+            file.write(chunk)
+
+    return Path(path).stat().st_size
+
+
+def write_split_pages(path, header, labels, entries, **options):
+    """
+    Write one page for each first-level tab and an index page linking them.
+
+    The pages are written next to `path` (eg `themes_Madrid.Rmd` next to
+    `themes.Rmd`). Returns the paths of the pages, with the index first, and
+    the entries on each.
+    """
+    path = Path(path)
+    # Group the entries by their first-level tab
+    groups = {}
+    for entry in entries:
+        groups.setdefault(entry['tabs'][0], []).append(entry)
+    paths = {name: path.with_stem(f'{path.stem}_{name}') for name in groups}
+    links = [(name, p.with_suffix('.html').name) for name, p in paths.items()]
+
+    pages = [(path, [])]
+    with open(path, 'w') as file:
+        file.write(header)
+        for name, href in links:
+            file.write(NAVIGATION.substitute(name=name, href=href))
+        file.write('\n' + FOOTER)
+    for name, group in groups.items():
+        write_page(paths[name], header, labels, group, links=links, **options)
+        pages.append((paths[name], group))
+
+    return pages
+
+
+def measure_page(header, labels, entries, **options):
+    """Get the size in bytes that the page would be, without writing it."""
+    chunks = render_page(header, labels, entries, **options)
+    return sum(len(chunk.encode()) for chunk in chunks)
+
+
+def get_payload(pages, thumbnail=None, image='png'):
+    """
+    Work out how much a browser downloads to show each page.
+
+    `pages` is a list of (path, entries) pairs. When the thumbnails are
+    shown, which are lazily loaded, only the page itself and the images of
+    its first tab are needed for the first paint. Otherwise every image on
+    the page is downloaded straight away.
+    """
+    def size(path):
+        return path.stat().st_size if path.exists() else 0
+
+    payload = []
+    for path, entries in pages:
+        page_size = size(Path(path))
+        images = [
+            [size(p) for p in get_image_paths(entry, thumbnail, image)]
+            for entry in entries
+        ]
+        total = page_size + sum(sum(i) for i in images)
+        first_paint = total
+        if thumbnail is not None:
+            first_paint = page_size + sum(images[0]) if images else page_size
+        payload.append((path, first_paint, total))
+
+    return payload
+
+
+def report_payload(payload):
+    """Print how much a browser downloads to show each page."""
+    print('Page weight (first paint / total):')
+    for path, first_paint, total in payload:
+        first_paint = first_paint / 1024
+        total = total / 1024
+        print(f'    {path}: {first_paint:.0f} kB / {total:.0f} kB')
+
+
+def knit(paths):
+    """Render R Markdown files to HTML and return the time taken."""
+    if shutil.which('Rscript') is None:
+        return None
+    start = time.perf_counter()
+    for path in paths:
+        subprocess.run(
+            ['Rscript', '-e', f'rmarkdown::render("{path}", quiet = TRUE)'],
+            check=True
+        )
+    return time.perf_counter() - start
+
+
+def report_page(paths, full_size=None, knit_time=None):
+    """Print the size of the page(s) and how long they took to knit."""
+    size = sum(Path(path).stat().st_size for path in paths)
+    message = f'{Path(paths[0]).name}: {size / 1024:.0f} kB'
+    if len(paths) > 1:
+        message += f' over {len(paths)} pages'
+    if full_size is not None:
+        message += f' ({full_size / 1024:.0f} kB with the code in every tab)'
+    print(message)
+    if knit_time is not None:
+        print(f'Knitted in {knit_time:.1f} s')
@@ -0,0 +1,177 @@
+"""
+Label and correct many p-values at once.
+
+`get_significance` and `round_p_value` turn a p-value into a string of stars
+and a human-readable number. These versions do the same for a whole array
+(or series) of p-values in one pass, so that the results of screening
+millions of tests can be labelled in seconds. They come with the usual
+corrections for multiple testing:
+
+- Bonferroni
+- Holm (step-down)
+- Benjamini-Hochberg (the false discovery rate)
+
+each of which sorts the p-values once (O(n log n)) instead of comparing each
+of them with all of the others. Missing p-values (NaN) are left out of the
+corrections and stay missing.
+
+Run this file to check the corrections against statsmodels' `multipletests`
+and to time them on a million p-values.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _like(result, p):
+    """Return a result in the form of the p-values: scalar, array or series."""
+    if isinstance(p, pd.Series):
+        return pd.Series(result, index=p.index, name=p.name)
+    if np.ndim(p) == 0:
+        return result.item()
+    return result
+
+
+def get_significance(p):
+    """Get the significance of p-values as strings of stars."""
+    values = np.asarray(p, dtype=float)
+    stars = np.select(
+        [values <= 0.001, values <= 0.01, values <= 0.05, values <= 0.1],
+        ['***', '**', '*', '.'], default=''
+    )
+    return _like(stars, p)
+
+
+def round_p_value(p):
+    """Round small p-values so that they are human-readable."""
+    values = np.asarray(p, dtype=float)
+    flat = values.ravel()
+    rounded = np.full(flat.shape, '<0.001', dtype='U8')
+    i = np.flatnonzero(~(flat < 0.001))
+    x = flat[i]
+    # Three significant figures, as f'{p:5.3}' does: the digits of each
+    # p-value as an integer (m) and the power of ten to divide it by
+    with np.errstate(invalid='ignore', divide='ignore'):
+        power = 2 - np.floor(np.log10(x))
+        scaled = x * 10**power
+    m = np.rint(scaled)
+    # Values (almost) half-way between two roundings are formatted one by
+    # one, as Python rounds their exact binary values
+    half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    odd = ~np.isfinite(scaled) | half
+    # Only a few thousand roundings are possible, so each is formatted once
+    keys = m[~odd].astype(np.int64) * 10 + power[~odd].astype(np.int64)
+    keys, inverse = np.unique(keys, return_inverse=True)
+    strings = np.array(
+        [f'{key // 10 / 10**(key % 10):5.3}' for key in keys], dtype='U8'
+    )
+    rounded[i[~odd]] = strings[inverse]
+    rounded[i[odd]] = [f'{value:5.3}' for value in x[odd]]
+
+    return _like(rounded.reshape(values.shape), p)
+
+
+def _sort(p):
+    """
+    Get the p-values as a flat array, the order that sorts those that are
+    not missing and how many of them there are.
+    """
+    values = np.asarray(p, dtype=float).ravel()
+    n = np.count_nonzero(~np.isnan(values))
+    # NaNs are sorted to the end
+    order = np.argsort(values, kind='stable')[:n]
+    return values, order, n
+
+
+def bonferroni(p):
+    """Adjust p-values with the Bonferroni correction."""
+    values = np.asarray(p, dtype=float)
+    n = np.count_nonzero(~np.isnan(values))
+    return _like(np.minimum(values * n, 1), p)
+
+
+def holm(p):
+    """Adjust p-values with Holm's step-down method."""
+    values, order, n = _sort(p)
+    # The ith smallest p-value (counting from 0) is multiplied by n - i, and
+    # none can be less than a smaller one's
+    stepped = (n - np.arange(n)) * values[order]
+    adjusted = np.full(values.shape, np.nan)
+    adjusted[order] = np.minimum(np.maximum.accumulate(stepped), 1)
+    return _like(adjusted.reshape(np.shape(p)), p)
+
+
+def benjamini_hochberg(p):
+    """Adjust p-values with the Benjamini-Hochberg method (the FDR)."""
+    values, order, n = _sort(p)
+    # The ith smallest p-value (counting from 1) is multiplied by n / i, and
+    # none can be more than a larger one's
+    stepped = values[order] * n / np.arange(1, n + 1)
+    adjusted = np.full(values.shape, np.nan)
+    adjusted[order] = np.minimum(
+        np.minimum.accumulate(stepped[::-1])[::-1], 1
+    )
+    return _like(adjusted.reshape(np.shape(p)), p)
+
+
+# The corrections, by their names in statsmodels' `multipletests`
+METHODS = {
+    'bonferroni': bonferroni,
+    'holm': holm,
+    'fdr_bh': benjamini_hochberg,
+}
+
+
+def adjust_p_values(p, method='fdr_bh'):
+    """Adjust p-values for multiple testing with one of the METHODS."""
+    if method not in METHODS:
+        raise ValueError(f'method must be one of {list(METHODS)}')
+    return METHODS[method](p)
+
+
+def label_p_values(p, method='fdr_bh'):
+    """
+    Correct p-values for multiple testing and label them.
+
+    Returns a data frame with the p-values, the adjusted p-values and the
+    rounded adjusted p-values and their significance.
+    """
+    p = pd.Series(p) if not isinstance(p, pd.Series) else p
+    p_adj = adjust_p_values(p, method)
+    return pd.DataFrame({
+        'p': p,
+        'p_adj': p_adj,
+        'p_adj_rounded': round_p_value(p_adj),
+        'significance': get_significance(p_adj),
+    })
+
+
+if __name__ == '__main__':
+    import time
+
+    from statsmodels.stats.multitest import multipletests
+
+    # A million p-values from a screen, a few of which are real effects
+    rng = np.random.default_rng(42)
+    p = rng.uniform(size=1_000_000)
+    p[:1000] = rng.uniform(0, 1e-6, size=1000)
+
+    for method in METHODS:
+        start = time.perf_counter()
+        table = label_p_values(p, method)
+        seconds = time.perf_counter() - start
+        expected = multipletests(p, method=method)[1]
+        assert np.allclose(table['p_adj'], expected, rtol=1e-12, atol=0)
+        significant = (table['p_adj'] <= 0.05).sum()
+        print(f'{method}: {significant} significant, labelled in '
+              f'{seconds:.2f}s')
+
+    # The labels are the same as those of the scalar functions
+    p = np.concatenate([p[:5000], [0.001, 0.0015, 0.0125, 0.99951, 1, np.nan]])
+    assert (round_p_value(p) == [
+        '<0.001' if x < 0.001 else f'{x:5.3}' for x in p
+    ]).all()
+    assert round_p_value(0.0123) == '0.0123'
+    assert get_significance(0.0123) == '*'
+    print(label_p_values(pd.Series(
+        [0.0001, 0.004, 0.019, 0.03, 0.2, np.nan], index=list('abcdef')
+    ), 'holm'))
@@ -0,0 +1,340 @@
+"""
+Streaming sufficient statistics for t-tests, ANOVA and Tukey's range test.
+
+The t-tests in `unpaired_two_sample_t_test.py` and the ANOVA and Tukey's
+range test in `tukeys_range_test.py` only need the size, mean and sum of
+squared deviations from the mean (M2) of each group. `GroupStatistics` keeps
+these for each group and can be updated with one chunk of data at a time, so
+samples that do not fit in memory (eg a large CSV file read in chunks) can be
+tested without ever being loaded in full:
+
+- each chunk is summarised with array operations (`np.bincount`)
+- the summaries are combined with Chan et al.'s formulae, which are the
+  parallel form of Welford's algorithm and do not lose precision the way that
+  adding up sums of squares does
+
+Accumulators can be merged (`a + b`) so that chunks can be summarised by
+several processes and the results combined.
+
+Run this file to check that streaming gives the same results as the tests
+that load all the data at once.
+"""
+import numpy as np
+import pandas as pd
+from scipy import stats as st
+
+from fast_tukey_hsd import fast_tukey_hsd
+
+
+class GroupStatistics:
+    """
+    The size, mean and sum of squared deviations (M2) of each group.
+
+    The values can be one column (`n`, `mean` and `m2` then have one element
+    per group) or several (one row per group and one column per column).
+    """
+
+    def __init__(self, groups=(), n=None, mean=None, m2=None):
+        self.groups = list(groups)
+        self._index = {group: i for i, group in enumerate(self.groups)}
+        k = len(self.groups)
+        self.n = np.zeros(k, dtype=np.int64) if n is None else np.asarray(n)
+        self.mean = np.zeros(k) if mean is None else np.asarray(mean, float)
+        self.m2 = np.zeros(k) if m2 is None else np.asarray(m2, float)
+
+    def __repr__(self):
+        return (
+            f'GroupStatistics(groups={self.groups}, n={self.n}, '
+            f'mean={self.mean}, m2={self.m2})'
+        )
+
+    def _add_groups(self, groups, shape):
+        """Add groups that are new, with no data, and get their indices."""
+        new = [group for group in groups if group not in self._index]
+        if new or self.mean.shape[1:] != shape:
+            if len(self.groups) and self.mean.shape[1:] != shape:
+                raise ValueError('The chunks have different columns')
+            for group in new:
+                self._index[group] = len(self.groups)
+                self.groups.append(group)
+            extra = len(self.groups) - len(self.n)
+            self.n = np.append(self.n, np.zeros(extra, dtype=np.int64))
+            pad = np.zeros((extra, *shape))
+            self.mean = np.concatenate([self.mean.reshape(-1, *shape), pad])
+            self.m2 = np.concatenate([self.m2.reshape(-1, *shape), pad])
+        return np.array([self._index[group] for group in groups], dtype=int)
+
+    @classmethod
+    def from_arrays(cls, values, codes, groups):
+        """
+        Summarise one chunk of data.
+
+        `values` has a row for each observation (and a column for each column,
+        if there are several) and `codes` is the index in `groups` of the
+        group of each observation (small integers, eg the codes of a
+        `pd.Categorical` whose categories are `groups`). Observations with a
+        code of -1 (a missing group) or a missing (non-finite) value, in any
+        column, are left out.
+        """
+        values = np.asarray(values, dtype=float)
+        codes = np.asarray(codes)
+        finite = np.isfinite(values).reshape(len(values), -1).all(axis=1)
+        keep = (codes >= 0) & finite
+        if not keep.all():
+            values = values[keep]
+            codes = codes[keep]
+        k = len(groups)
+        n = np.bincount(codes, minlength=k)
+        sums = group_sum(codes, values, k)
+        # Groups with no observations have a mean of zero
+        mean = sums / np.maximum(n, 1).reshape(-1, *[1] * (values.ndim - 1))
+        # Sum the squared deviations from each group's own mean
+        deviations = values - mean[codes]
+        m2 = group_sum(codes, deviations**2, k)
+
+        return cls(groups, n, mean, m2)
+
+    @classmethod
+    def from_runs(cls, values, lengths, groups):
+        """
+        Summarise one chunk of data that is sorted by group, from the number
+        of values in each group (the lengths of the runs of each group).
+        """
+        values = np.asarray(values, dtype=float)
+        n = np.asarray(lengths, dtype=np.int64)
+        if n.sum() != len(values):
+            raise ValueError('The lengths do not add up to len(values)')
+        # Empty groups have no runs to add up
+        starts = (np.cumsum(n) - n)[n > 0]
+        sums = np.zeros((len(n), *values.shape[1:]))
+        sums[n > 0] = np.add.reduceat(values, starts)
+        mean = sums / np.maximum(n, 1).reshape(-1, *[1] * (values.ndim - 1))
+        # Sum the squared deviations from each group's own mean
+        deviations = values - np.repeat(mean, n, axis=0)
+        m2 = np.zeros_like(sums)
+        m2[n > 0] = np.add.reduceat(deviations**2, starts)
+
+        return cls(groups, n, mean, m2)
+
+    def update(self, values, groups):
+        """
+        Add a chunk of data: the values and the group of each one.
+
+        The groups are best given as a `pd.Categorical` (or a series of one),
+        which is factorised from its integer codes without comparing its
+        labels. Either way, the groups are numbered in the order in which
+        they first appear: categories that do not appear in the chunk are
+        left out, as are missing groups.
+        """
+        if not isinstance(groups, (pd.Series, pd.Categorical, np.ndarray)):
+            groups = np.asarray(groups)
+        codes, uniques = pd.factorize(groups)
+        chunk = GroupStatistics.from_arrays(values, codes, list(uniques))
+        self.merge(chunk)
+        return self
+
+    def merge(self, other):
+        """Combine the statistics of another accumulator with these."""
+        values_shape = other.mean.shape[1:]
+        i = self._add_groups(other.groups, values_shape)
+        n_a = self.n[i]
+        n_b = other.n
+        n = n_a + n_b
+        # The share of the combined group that comes from the other one
+        with np.errstate(invalid='ignore', divide='ignore'):
+            share = np.where(n > 0, n_b / n, 0)
+        shape = (-1, *[1] * len(values_shape))
+        delta = other.mean - self.mean[i]
+        self.mean[i] = self.mean[i] + delta * share.reshape(shape)
+        self.m2[i] = (
+            self.m2[i] + other.m2 + delta**2 * (n_a * share).reshape(shape)
+        )
+        self.n[i] = n
+        return self
+
+    def __add__(self, other):
+        return self.copy().merge(other)
+
+    def copy(self):
+        return GroupStatistics(
+            self.groups, self.n.copy(), self.mean.copy(), self.m2.copy()
+        )
+
+    def observed(self):
+        """Get the statistics of the groups that have any data."""
+        return self.get([g for g, n in zip(self.groups, self.n) if n > 0])
+
+    def get(self, groups):
+        """Get the statistics of some of the groups, in the order given."""
+        i = [self._index[group] for group in groups]
+        return GroupStatistics(groups, self.n[i], self.mean[i], self.m2[i])
+
+    @property
+    def variance(self):
+        """The sample variance (with n - 1 degrees of freedom)."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.m2 / (self._n - 1)
+
+    @property
+    def _n(self):
+        """The sizes of the groups, shaped to divide the other statistics."""
+        return self.n.reshape(-1, *[1] * (self.mean.ndim - 1))
+
+
+def group_sum(codes, values, k):
+    """Sum values (one row per observation) by group."""
+    if values.ndim == 1:
+        return np.bincount(codes, weights=values, minlength=k)
+    sums = np.zeros((k, *values.shape[1:]))
+    np.add.at(sums, codes, values)
+    return sums
+
+
+def accumulate(chunks, value_col, group_col, statistics=None):
+    """
+    Summarise chunks of a data set (eg from `pd.read_csv(chunksize=...)`).
+
+    `value_col` is the column of values (or a list of columns) and
+    `group_col` is the column of groups.
+    """
+    statistics = statistics or GroupStatistics()
+    for chunk in chunks:
+        statistics.update(chunk[value_col].to_numpy(), chunk[group_col])
+    return statistics
+
+
+def t_test(statistics, a, b, equal_var=True):
+    """
+    Compare the means of two groups with an unpaired t-test.
+
+    Returns the difference between the means (a - b), its standard error,
+    the t-statistic, the degrees of freedom and the p-value, as in
+    `unpaired_two_sample_t_test.py` (and `st.ttest_ind`).
+    """
+    pair = statistics.get([a, b])
+    n = pair._n.astype(float)
+    s2 = pair.variance
+    diff_btwn_means = pair.mean[0] - pair.mean[1]
+    if equal_var:
+        dof = n[0] + n[1] - 2
+        # Pooled standard deviation
+        s_p = np.sqrt(((n[0] - 1) * s2[0] + (n[1] - 1) * s2[1]) / dof)
+        se = s_p * np.sqrt(1 / n[0] + 1 / n[1])
+    else:
+        v = s2 / n
+        se = np.sqrt(v[0] + v[1])
+        dof = (v[0] + v[1])**2 / (v[0]**2 / (n[0] - 1) + v[1]**2 / (n[1] - 1))
+    t_statistic = diff_btwn_means / se
+    p_value = 2 * st.t.sf(np.abs(t_statistic), dof)
+
+    return diff_btwn_means, se, t_statistic, dof, p_value
+
+
+def f_oneway(statistics):
+    """
+    One-way ANOVA of all of the groups.
+
+    Returns the F-statistic and the p-value, as `st.f_oneway` does.
+    """
+    statistics = statistics.observed()
+    n = statistics._n.astype(float)
+    total = n.sum(axis=0)
+    grand_mean = (n * statistics.mean).sum(axis=0) / total
+    ss_between = (n * (statistics.mean - grand_mean)**2).sum(axis=0)
+    ss_within = statistics.m2.sum(axis=0)
+    df_between = len(statistics.groups) - 1
+    df_within = total - len(statistics.groups)
+    f_statistic = (ss_between / df_between) / (ss_within / df_within)
+    p_value = st.f.sf(f_statistic, df_between, df_within)
+
+    return f_statistic, p_value
+
+
+def tukey_hsd(statistics, alpha=0.05):
+    """
+    Tukey's range test of every pair of groups (of one column).
+
+    The groups are sorted, as `pairwise_tukeyhsd` does, and the result has
+    the same columns as its summary table.
+    """
+    statistics = statistics.observed()
+    return fast_tukey_hsd(
+        statistics.groups, statistics.n, statistics.mean, statistics.variance,
+        alpha
+    )
+
+
+if __name__ == '__main__':
+    from concurrent.futures import ProcessPoolExecutor
+    import tempfile
+
+    from statsmodels import api as sm
+    from statsmodels.stats.multicomp import pairwise_tukeyhsd
+
+    # The travel mode choice data of tukeys_range_test.py
+    df = sm.datasets.modechoice.load_pandas()['data']
+    df['mode'] = df['mode'].replace({1: 'Air', 2: 'Train', 3: 'Bus', 4: 'Car'})
+    df = df[['invt', 'mode']]
+
+    # Stream the data from a CSV file in chunks
+    with tempfile.NamedTemporaryFile(suffix='.csv') as file:
+        df.to_csv(file.name, index=False)
+        chunks = pd.read_csv(file.name, chunksize=100)
+        statistics = accumulate(chunks, 'invt', 'mode')
+    print(statistics)
+
+    # Summarise halves of the data in separate processes and merge them
+    halves = [df.iloc[:len(df) // 2], df.iloc[len(df) // 2:]]
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        parts = list(executor.map(accumulate, [[half] for half in halves],
+                                  ['invt'] * 2, ['mode'] * 2))
+    merged = parts[0] + parts[1]
+    assert np.allclose(merged.get(statistics.groups).m2, statistics.m2)
+
+    # Compare with the tests that load all of the data at once
+    samples = {mode: df.loc[df['mode'] == mode, 'invt'] for mode in
+               ['Train', 'Bus', 'Car']}
+    _, _, t_statistic, _, p_value = t_test(statistics, 'Train', 'Bus')
+    expected = st.ttest_ind(samples['Train'], samples['Bus'])
+    print(f'Streamed t-test: t = {t_statistic:.4f}, p = {p_value:.4e}')
+    assert np.allclose([t_statistic, p_value], expected)
+    _, _, t_statistic, _, p_value = t_test(statistics, 'Train', 'Bus', False)
+    expected = st.ttest_ind(samples['Train'], samples['Bus'], equal_var=False)
+    assert np.allclose([t_statistic, p_value], expected)
+
+    three = statistics.get(['Train', 'Bus', 'Car'])
+    f_statistic, p_value = f_oneway(three)
+    print(f'Streamed one-way ANOVA: F = {f_statistic:.2f}, p = {p_value:.2e}')
+    assert np.allclose([f_statistic, p_value], st.f_oneway(*samples.values()))
+
+    streamed = tukey_hsd(three, 0.10)
+    print(streamed)
+    df = df[df['mode'] != 'Air']
+    in_memory = pairwise_tukeyhsd(df['invt'], df['mode'], 0.10)
+    table = pd.DataFrame(
+        in_memory.summary().data[1:], columns=in_memory.summary().data[0]
+    )
+    assert (streamed[['group1', 'group2']] == table[['group1', 'group2']]).all(
+        axis=None
+    )
+    assert np.allclose(streamed['meandiff'], in_memory.meandiffs)
+    assert np.allclose(
+        streamed['p-adj'], in_memory.pvalues, rtol=0, atol=1e-6
+    )
+    assert np.allclose(
+        streamed[['lower', 'upper']], in_memory.confint, rtol=0, atol=1e-4
+    )
+    assert (streamed['reject'] == in_memory.reject).all()
+    print('The streamed results match the in-memory ones')
+
+    # Missing values are left out, as pandas does, even when they are alone
+    # in a chunk
+    values = pd.Series([1, np.nan, 3, 10, 12])
+    groups = pd.Series(['a', 'a', 'a', 'b', 'b'])
+    chunked = GroupStatistics()
+    for chunk in [slice(0, 1), slice(1, 2), slice(2, 5)]:
+        chunked.update(values[chunk], groups[chunk])
+    expected = values.groupby(groups).agg(['count', 'mean', 'var'])
+    assert (chunked.n == expected['count']).all()
+    assert np.allclose(chunked.mean, expected['mean'])
+    assert np.allclose(chunked.variance, expected['var'])
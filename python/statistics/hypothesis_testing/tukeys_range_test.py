@@ -1,16 +1,18 @@
 """Tukey's Range Test."""
 from statsmodels import api as sm
-from statsmodels.stats.multicomp import pairwise_tukeyhsd
 from matplotlib import pyplot as plt
 from matplotlib import lines
 import seaborn as sns
-from scipy import stats as st
+import numpy as np
+import pandas as pd
+
+from sufficient_statistics import GroupStatistics, f_oneway, tukey_hsd
 
 #
 # Codecademy example
 #
 # Sale data
-endog = [
+endog = np.array([
     73.57, 38.37, 49.36, 61.96, 38.74, 55.95, 36.65, 60.67, 63.08, 87.32,
     50.34, 57.11, 78.68, 61.04, 82.29, 53.59, 72.92, 74.56, 55.03, 41.26,
     53.8, 64.8, 70.7, 66.74, 75.01, 95.13, 49.46, 66.04, 53.03, 73.36,
@@ -57,45 +59,14 @@ endog = [
     65.85, 94.96, 69.97, 73.35, 75.06, 57.52, 62.37, 58.81, 63.38, 35.88,
     46.23, 56.05, 55.34, 45.85, 51.94, 70.16, 65.98, 50.51, 46.77, 70.39,
     42.06
-]
-# Store data
-groups = [
-    'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A',
-    'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A',
-    'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A',
-    'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A',
-    'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A',
-    'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A',
-    'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A',
-    'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A',
-    'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A',
-    'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A',
-    'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'B', 'B', 'B', 'B',
-    'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B',
-    'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B',
-    'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B',
-    'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B',
-    'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B',
-    'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B',
-    'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B',
-    'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B',
-    'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B',
-    'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B', 'B',
-    'B', 'B', 'B', 'B', 'B', 'B', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C',
-    'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C',
-    'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C',
-    'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C',
-    'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C',
-    'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C',
-    'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C',
-    'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C',
-    'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C',
-    'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C',
-    'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C', 'C',
-    'C', 'C'
-]
+])
+# Store the groups as the number of values in each (the data is sorted by
+# group) instead of as a label for each value
+group_names = ['A', 'B', 'C']
+group_sizes = [150, 150, 150]
 alpha = 0.05
-tukey_results = pairwise_tukeyhsd(endog, groups, alpha)
+statistics = GroupStatistics.from_runs(endog, group_sizes, group_names)
+tukey_results = tukey_hsd(statistics, alpha)
 # print(tukey_results)
 
 # Load the dataset
@@ -106,8 +77,12 @@ print(type(dataset))
 print(list(dataset))
 print(df.head())
 
-df['mode'] = df['mode'].replace({1: 'Air', 2: 'Train', 3: 'Bus', 4: 'Car'})
+# Store the modes as codes with a table of their names
+df['mode'] = pd.Categorical.from_codes(
+    df['mode'].astype(int) - 1, ['Air', 'Train', 'Bus', 'Car']
+)
 df = df[df['mode'] != 'Air']
+df = df.assign(mode=df['mode'].cat.remove_unused_categories())
 
 cols = ['invt', 'mode']
 df = df[cols]
@@ -139,22 +114,24 @@ ax.legend(handles, ['Group Means'])
 n = df['mode'].value_counts()
 print(n)
 
-# Homogeneity of variance (using sample standard deviations)
-s = df.groupby('mode')['invt'].std(ddof=1)
+# Homogeneity of variance (using sample standard deviations), with the modes
+# in alphabetical order
+s = df.groupby('mode', observed=True)['invt'].std(ddof=1)
+s = s.sort_index(key=lambda i: i.astype(str))
 for i in range(3):
     for j in range(i + 1, 3):
-        ratio = s[i] / s[j]
+        ratio = s.iloc[i] / s.iloc[j]
         print(f'Ratio of standard deviations: {ratio:.2f}')
 
-# Samples
-sample_0 = df[df['mode'] == 'Train']['invt']
-sample_1 = df[df['mode'] == 'Bus']['invt']
-sample_2 = df[df['mode'] == 'Car']['invt']
+# Size, mean and variance of each sample, from the codes of the modes
+statistics = GroupStatistics.from_arrays(
+    df['invt'], df['mode'].cat.codes, df['mode'].cat.categories
+)
 
 # One-way ANOVA
-f_statistic, p_value = st.f_oneway(sample_0, sample_1, sample_2)
+f_statistic, p_value = f_oneway(statistics)
 print(f'One-way ANOVA: F = {f_statistic:.2f}, p = {p_value:.2e}')
 
 # Tukey's range test
-tukey_results = pairwise_tukeyhsd(df['invt'], df['mode'], 0.10)
-print(tukey_results)
+tukey_results = tukey_hsd(statistics, 0.10)
+print(tukey_results.round(4))
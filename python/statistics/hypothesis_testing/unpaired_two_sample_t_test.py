@@ -6,6 +6,8 @@ from matplotlib import pyplot as plt
 from matplotlib import lines
 import seaborn as sns
 
+from p_values import get_significance, round_p_value
+
 """
 Example Data
 """
@@ -129,29 +131,6 @@ benign = df.groupby('target').get_group('benign')
 t_statistic, p_value = st.ttest_ind(malignant['smoothness'], benign['smoothness'])
 print(f'Two-sample t-test: s = {t_statistic:5.3f}, p = {p_value:.2e}')
 
-
-def get_significance(p):
-    """Get the significance of a p-values as a string of stars."""
-    if p <= 0.001:
-        return '***'
-    elif p <= 0.01:
-        return '**'
-    elif p <= 0.05:
-        return '*'
-    elif p <= 0.1:
-        return '.'
-    else:
-        return ''
-
-
-def round_p_value(p):
-    """Round a small p-value so that it is human-readable."""
-    if p < 0.001:
-        return '<0.001'
-    else:
-        return f'{p:5.3}'
-
-
 p_rounded = round_p_value(p_value)
 significance = get_significance(p_value)
 
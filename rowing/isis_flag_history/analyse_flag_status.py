@@ -1,272 +1,234 @@
 """Plot the Isis flag status."""
-import pandas as pd
 import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from datetime import datetime, timezone, timedelta
+from contextlib import ExitStack
+from datetime import datetime, timezone
 import platform
 import argparse
 
+from flag_history import FIRST_YEAR, load_terms, load_flag_history, \
+    get_last_set_date, pad_history, resample_hourly, split_terms
+from flag_live import get_new_hours
+from flag_plot import RENDERERS, LABEL_SIZE, DATE_TEXTS, MONTH_TEXTS
+from flag_report import get_stem, report_terms, report_comparison, \
+    write_summary, write_comparison
+from flag_stats import get_peak_term_percentages
+from flag_store import REACHES, get_reach_path
+from flag_text import TEXT_MODES, LABEL_CACHE, use_text, get_label_cache
+from flag_timing import StageLog, get_run_id, profiled
+from term_calendar import get_terms, get_peak_term
+
 if platform.system() == 'Linux':
     # Set the Matplotlib backend to one that is compatible with Wayland
     plt.switch_backend('Agg')
 
-# Use LaTeX for graphs' text
-plt.rc('text', usetex=True)
-# Use the serif font
-plt.rc('font', family='serif')
-# Be able to use Greek symbols in text mode
-plt.rc('text.latex', preamble=r'\usepackage{textgreek}')
-
-
-def cardinal_to_ordinal(cardinal):
-    """Convert a cordinal number to an ordinal number."""
-    if cardinal % 10 == 1:
-        return f'{cardinal}st'
-    elif cardinal % 10 == 2:
-        return f'{cardinal}nd'
-    elif cardinal % 10 == 3:
-        return f'{cardinal}rd'
-    else:
-        return f'{cardinal}th'
-
-
 # Create command-line argument parser
 parser = argparse.ArgumentParser()
 # Add optional arguments
 parser.add_argument('--latest_only', '-l', action='store_true')
-parser.add_argument('--path', '-p', default='master.csv')
+parser.add_argument(
+    '--reaches', '-R', nargs='+', default=['isis'],
+    help=f'reaches to analyse, side by side if more than one (eg '
+    f'{" ".join(REACHES)})'
+)
+parser.add_argument(
+    '--folder', '-f', default='.',
+    help='folder of the change logs (master.csv for the Isis, <reach>.csv)'
+)
+parser.add_argument(
+    '--path', '-p', default=None,
+    help='change log to analyse instead of that of the (one) reach'
+)
+parser.add_argument('--renderer', '-r', choices=RENDERERS, default='grid')
+parser.add_argument(
+    '--exact', action='store_true',
+    help='use the exact time under each flag instead of counting hours'
+)
+parser.add_argument(
+    '--terms', '-t', default=None,
+    help='CSV file of the terms to analyse (default: work them out)'
+)
+parser.add_argument(
+    '--years', '-y', type=int, nargs='+', default=None,
+    help=f'first (and last) year of the terms to analyse (default: '
+    f'{FIRST_YEAR} to now)'
+)
+parser.add_argument(
+    '--jobs', '-j', type=int, default=None,
+    help='number of terms to draw at once (default: one per CPU)'
+)
+parser.add_argument(
+    '--summary', '-s', default='peak_term_summary.txt',
+    help='file to write the table of every term to (prefixed by the reach)'
+)
+parser.add_argument(
+    '--text', choices=TEXT_MODES, default='tex',
+    help='typeset the text with LaTeX or with Matplotlib (default: tex)'
+)
+parser.add_argument(
+    '--label_cache', default=LABEL_CACHE,
+    help=f'file of cached label outlines (default: {LABEL_CACHE})'
+)
+parser.add_argument(
+    '--no_label_cache', action='store_true',
+    help='write the dates and months as text instead of from the cache'
+)
+parser.add_argument(
+    '--incremental', '-i', action='store_true',
+    help='with --latest_only, only redraw the hours of the calendar that have '
+    'changed since the last run (with the grid renderer)'
+)
+parser.add_argument(
+    '--timings', default=None,
+    help='file to append the time taken by each stage to, as JSON lines'
+)
+parser.add_argument(
+    '--profile', default=None, metavar='FOLDER',
+    help='profile the run with cProfile and tracemalloc, writing the reports '
+    'to this folder (the terms are then drawn one after another)'
+)
 # Parse arguments from terminal
 args = parser.parse_args()
-
-# Import data
-df = pd.read_csv(args.path)
-# Trim
-cols = ['status_text', 'set_date']
-df = df[cols]
-
-# Convert 'set_date' column to datetime objects
-df['set_date'] = pd.to_datetime(df['set_date'], format='ISO8601')
-
-# Duplicate the colour column
-df['colour'] = df['status_text']
-# Convert colours to Matplotlib colours
-df['colour'] = df['colour'].replace('Black', '#212121')
-df['colour'] = df['colour'].replace('Red', '#E74C3C')
-df['colour'] = df['colour'].replace('Amber', '#F0B23E')
-df['colour'] = df['colour'].replace('Dark Blue', '#1C71A6')
-df['colour'] = df['colour'].replace('Light Blue', 'lightblue')
-df['colour'] = df['colour'].replace('Green', '#70A35E')
-df['colour'] = df['colour'].replace('Grey', 'grey')
-
-terms = [
-    # (year, term, start of 0th Week, end of Peak Term)
-    # ('2023', 'Hilary', '2023-01-08T00:00:00Z', '2023-02-25T23:00:00Z'),
-    # ('2023', 'Trinity', '2023-04-16T00:00:00Z', '2023-05-27T23:00:00Z'),
-    # ('2023', 'Michaelmas', '2023-10-01T00:00:00Z', '2023-11-25T23:00:00Z'),
-    # ('2024', 'Hilary', '2024-01-07T00:00:00Z', '2024-03-02T23:00:00Z'),
-    # ('2024', 'Trinity', '2024-04-14T00:00:00Z', '2024-05-25T23:00:00Z'),
-    # ('2024', 'Michaelmas', '2024-10-06T00:00:00Z', '2024-11-30T23:00:00Z'),
-    ('2025', 'Hilary', '2025-01-12T00:00:00Z', '2025-03-01T23:00:00Z'),
-]
-
-# Forward fill to either today or the next 9th week
-latest_term = terms[-1]
-# First day of 0th week
-noughth_start = datetime.fromisoformat(latest_term[2])
-# End of 9th week
-ninth_end = noughth_start + timedelta(weeks=10) - timedelta(hours=1)
-# Current datetime
+if args.path is not None and len(args.reaches) > 1:
+    parser.error('--path can only be used with one reach')
+if args.incremental and not args.latest_only:
+    parser.error('--incremental can only be used with --latest_only')
+if args.incremental and args.renderer != 'grid':
+    parser.error('--incremental can only be used with the grid renderer')
+if args.incremental and len(args.reaches) > 1:
+    parser.error('--incremental can only be used with one reach')
+
+# Profile everything that follows, if asked to
+stack = ExitStack()
+stack.enter_context(profiled(args.profile))
+jobs = 1 if args.profile else args.jobs
+log = StageLog(args.timings, run=get_run_id())
+
+# Decide which terms to analyse: every term in the years asked for that had
+# started by the latest change of flag (so that terms after the end of the
+# history are not filled in with its last flag)
 now = datetime.now(timezone.utc)
-# Append a new row with today's date or the end of 9th Week, whichever is
-# later
-if now > ninth_end:
-    # If it is currently vacation time (ie after the end of the latest term)
-    new_row_1 = {'set_date': ninth_end + timedelta(hours=1), 'colour': 'white'}
-    new_row_2 = {'set_date': now, 'colour': 'white'}
+if args.terms is None:
+    years = args.years or [FIRST_YEAR]
+    last_change = max(
+        get_last_set_date(args.path or get_reach_path(reach, args.folder))
+        for reach in args.reaches
+    )
+    until = min(now, last_change)
+    terms = get_terms(years[0], years[-1] if len(years) > 1 else None, until)
 else:
-    # If it is currently term time (ie before the end of the latest term)
-    new_row_1 = {'set_date': now, 'colour': 'white'}
-    new_row_2 = {'set_date': ninth_end, 'colour': 'white'}
-new_row_1 = pd.DataFrame(new_row_1, index=[0])
-df = pd.concat([df, new_row_1], ignore_index=True)
-new_row_2 = pd.DataFrame(new_row_2, index=[0])
-df = pd.concat([df, new_row_2], ignore_index=True)
-
-# Forward-fill the gaps in the data
-df = df.rename(columns={'set_date': 'datetime'})
-df = df.set_index('datetime')
-df = df.resample('1h').ffill()
-df.reset_index(inplace=True)
-
-# Decide which terms to analyse
+    terms = load_terms(args.terms)
 if args.latest_only:
     terms_to_analyse = terms[-1:]
 else:
     terms_to_analyse = terms
 
-# Iterate through the terms
-for term in terms_to_analyse:
-    year = term[0]
-    term_name = term[1]
-    # First day of 0th week
-    noughth_start = datetime.fromisoformat(term[2])
-    # End of Peak Term
-    peak_term_end = datetime.fromisoformat(term[3])
-
-    # End of 9th week
-    ninth_end = noughth_start + timedelta(weeks=10) - timedelta(hours=1)
-    # Start of Peak Term
-    peak_term_start = noughth_start + timedelta(days=4)
-    # Current datetime
-    now = datetime.now(timezone.utc)
-
-    # Extract Full Term
-    bl = (df['datetime'] >= noughth_start) & (df['datetime'] <= ninth_end)
-    full_term = df[bl].copy()
-
-    # Extract Peak Term
-    bl = (df['datetime'] >= peak_term_start) & \
-        (df['datetime'] <= peak_term_end)
-    peak_term = df[bl]
-    # Remove the placeholder flag (the "white" flag")
-    peak_term = peak_term[peak_term['colour'] != 'white']
-    # Get the percentage of hours under each colour flag
-    colour_counts = peak_term['status_text'].value_counts()
-    colour_percentage = (colour_counts / len(peak_term)) * 100
-    colour_percentage = colour_percentage.round(1)
-
-    # Define the flag colours
-    colours = [
-        'Black', 'Red', 'Amber', 'Dark Blue', 'Light Blue', 'Green', 'Grey'
-    ]
-    # Export to external file
-    with open(f'{year}_{term_name.lower()}_term.txt', 'w') as file:
-        if now > peak_term_end:
-            file.write('Percentage of Peak Term* under each flag:\n')
-        else:
-            file.write('Percentage of Peak Term* - so far - under each flag:')
-            file.write('\n')
-        file.write('\n')
-        file.write('| | % |\n')
-        file.write('|---|:---:|\n')
-        for colour in colours:
-            if colour in colour_percentage.index:
-                file.write(f'| {colour} | {colour_percentage[colour]} |\n')
-            else:
-                file.write(f'| {colour} | 0 |\n')
-        file.write('\n')
-        start = peak_term_start.date()
-        end = peak_term_end.date()
-        file.write(f'*{start} to {end} inclusive')
-
-    # Get the number of weeks since the start of 0th week
-    ser = (full_term.loc[:, 'datetime'] - noughth_start).dt.days
-    full_term.loc[:, 'oxford_week_number'] = ser // 7
-
-    # Get ISO week number
-    full_term['iso_week_number'] = full_term['datetime'].dt.isocalendar().week
-
-    # Define the figure and axis
-    fig, ax = plt.subplots(figsize=(6, 4), dpi=141)
-    # Create a flag to indicate if we need to add the month in the first block
-    month_in_first_block = True
-    # Loop through each week
-    for week_number, week_data in full_term.groupby('oxford_week_number'):
-        # Plot rectangles for each hour
-        for index, row in week_data.iterrows():
-            # Convert datetime to days-since-epoch
-            x = mdates.date2num(row['datetime'])
-            # 1970-01-01 was a Thursday, so subtract 3 days to pretend it was a
-            # Monday (which we will label as "Sunday")
-            x = x - 3
-            # Get only the fractions of the week
-            x = x % 7
-            # Plot the week number on the y-axis
-            y = week_number
-            # Plot with an offset so as to align with the centre of the labels
-            x = x - 0.5
-            y = y - 0.5
-
-            width = 1 / 24  # each hour
-            height = 1
-
-            # Plot the rectangle
-            rect = plt.Rectangle((x, y), width, height, color=row['colour'])
-            ax.add_patch(rect)
-
-            # Add the date as text in every 24th rectangle
-            if index % 24 == 8:
-                date_text = row['datetime'].strftime('%d').lstrip('0')
-                ax.text(
-                    # Align text horizontally in the rectangle
-                    x + width / 2,
-                    # Align text vertically in the rectangle
-                    y + height / 1.3,
-                    # The date as text
-                    date_text,
-                    # Horizontal alignment
-                    ha='center',
-                    # Vertical alignment
-                    va='center',
-                    # Font size
-                    fontsize=6,
-                    # Text color
-                    color='w'
-                )
-
-            # Add the month name as text in the relevant rectangles
-            if (row['datetime'].day == 1 or month_in_first_block):
-                if row['datetime'].hour == 1:
-                    # first_day = (index == week_data.index[0] + 12) and \
-                    #     (week_number == 0)
-                    # print(row['datetime'], row['datetime'].strftime('%H'))
-                    month_text = row['datetime'].strftime('%B')
-                    ax.text(
-                        # Align text horizontally in the rectangle
-                        x + width / 2,
-                        # Align text vertically in the rectangle
-                        y + height / 3.5,
-                        # The date as text
-                        month_text,
-                        # Vertical alignment
-                        va='center',
-                        # Font size
-                        fontsize=6,
-                        # Text color
-                        color='w',
-                    )
-                    month_in_first_block = False
-
-    # Construct the x-axis so as to represent days of the week
-    ax.set_xticks(range(7))
-    labels = ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat']
-    ax.set_xticklabels(labels, fontsize=8)
-    ax.set_xlim(-0.5, 6.5)
-    # Remove black lines on the major x-axis ticks
-    ax.tick_params(axis='x', which='major', length=0)
-    # Add minor ticks on the x-axis without labels
-    ax.set_xticks([i + 0.5 for i in range(7)], minor=True)
-    # Add grid lines
-    ax.grid(axis='x', which='minor', linestyle='-')
-
-    # Construct the y-axis so as to represent weeks
-    start_week = int(full_term['oxford_week_number'].min())
-    end_week = int(full_term['oxford_week_number'].max())
-    num_weeks = end_week - start_week + 1
-    ax.set_ylim(end_week + 0.5, start_week - 0.5)
-    ax.set_yticks(range(start_week, end_week + 1))
-    # Construct the week names
-    week_names = [f'{cardinal_to_ordinal(i)} Week' for i in range(num_weeks)]
-    ax.set_yticklabels(week_names, fontsize=8)
-    # Remove black lines on the major y-axis ticks
-    ax.tick_params(axis='y', which='major', length=0)
-    # Add minor ticks on y-axis without labels
-    ax.set_yticks([i + 0.5 for i in range(num_weeks)], minor=True)
-    # Add grid lines
-    ax.grid(axis='y', which='minor', linestyle='-')
-
-    # Set title and labels
-    st = f"""OURCs Isis Flag
-    {term_name} Term {year}"""
-    plt.title(st, fontsize=12)
-    plt.savefig(f'{year}_{term_name.lower()}_term.png')
+# Typeset the graphs' text with LaTeX or with Matplotlib
+use_text(args.text)
+label_cache = None if args.no_label_cache else args.label_cache
+if label_cache is not None:
+    # Typeset every date and month that is not already in the cache, before
+    # any worker processes are started, so that they all share the outlines
+    with log.stage('label_cache'):
+        labels = get_label_cache(label_cache)
+        labels.warm(DATE_TEXTS + MONTH_TEXTS, LABEL_SIZE)
+        labels.save()
+
+# The start of the earliest term to be analysed
+start = min(datetime.fromisoformat(term[2]) for term in terms_to_analyse)
+
+# Describe the output of each term of each reach
+tasks = []
+full_terms = {}
+percentages = {}
+for reach in args.reaches:
+    # Import data, from the start of the earliest term onwards
+    path = args.path or get_reach_path(reach, args.folder)
+    reach_log = log.bind(reach=reach)
+    with reach_log.stage('load') as record:
+        history = load_flag_history(path, start=start)
+        record['rows'] = len(history)
+
+    # Get the percentage of each Peak Term under each colour flag, straight
+    # from the changes of flag
+    with reach_log.stage('interval_stats', terms=len(terms_to_analyse)):
+        percentages[reach] = get_peak_term_percentages(
+            history, terms_to_analyse, now, exact=args.exact
+        )
+
+    if args.incremental:
+        # Only forward fill the hours since the calendar was last updated
+        with reach_log.stage('resample') as record:
+            term = terms_to_analyse[0]
+            stem = get_stem(term[0], term[1], reach)
+            full_terms[reach] = [get_new_hours(
+                f'{stem}.png', history, term, now, reach,
+                label_cache is not None
+            )]
+            record['rows'] = len(full_terms[reach][0])
+    else:
+        # Forward fill to either today or the next 9th week
+        with reach_log.stage('resample') as record:
+            df = pad_history(history, terms[-1], now)
+            df = resample_hourly(df)
+            record['rows'] = len(df)
+        # Extract Full Term (with its week numbers) of every term at once
+        with reach_log.stage('split_terms', terms=len(terms_to_analyse)):
+            full_terms[reach] = split_terms(df, terms_to_analyse)
+
+    for term, full_term in zip(terms_to_analyse, full_terms[reach]):
+        year = term[0]
+        term_name = term[1]
+        # Start and end of Peak Term
+        peak_term_start, peak_term_end = get_peak_term(term)
+        colour_percentage = percentages[reach].loc[(year, term_name)]
+        tasks.append({
+            'reach': reach,
+            'term': term,
+            'year': year,
+            'term_name': term_name,
+            'full_term': full_term,
+            # The percentage of Peak Term under each colour flag that has
+            # flown
+            'colour_percentage': colour_percentage.dropna(),
+            'peak_term_start': peak_term_start,
+            'peak_term_end': peak_term_end,
+            'now': now,
+            'renderer': args.renderer,
+            'label_cache': label_cache,
+            'log': log,
+            'incremental': args.incremental,
+        })
+
+# Export the tables and calendars
+with log.stage('report', terms=len(tasks)):
+    report_terms(tasks, jobs)
+if len(terms_to_analyse) > 1:
+    with log.stage('summary'):
+        for reach in args.reaches:
+            prefix = '' if reach == 'isis' else f'{reach}_'
+            write_summary(
+                prefix + args.summary, percentages[reach], terms_to_analyse,
+                now
+            )
+
+# Compare the reaches side by side
+if len(args.reaches) > 1:
+    comparisons = []
+    for i, term in enumerate(terms_to_analyse):
+        comparisons.append({
+            'year': term[0],
+            'term_name': term[1],
+            'full_terms': [full_terms[reach][i] for reach in args.reaches],
+            'reaches': args.reaches,
+            'renderer': args.renderer,
+            'label_cache': label_cache,
+            'log': log,
+        })
+    with log.stage('compare', terms=len(comparisons)):
+        report_terms(comparisons, jobs, report=report_comparison)
+        write_comparison(
+            'peak_term_reaches.txt', percentages, terms_to_analyse, now
+        )
+
+# Write the profiling reports
+stack.close()
@@ -0,0 +1,189 @@
+"""
+Time each stage of the Isis flag pipeline on synthetic histories.
+
+For each size of history, a synthetic history (see synthetic_history.py) is
+written to a temporary folder and put through the same stages as
+analyse_flag_status.py, timing each stage and measuring the most memory that
+it allocates at once:
+
+- load_csv: reading the CSV file
+- migrate: writing the binary sidecar
+- load_sidecar: reading the binary sidecar
+- append: appending new changes of flag one at a time
+- interval_stats: the percentage of each Peak Term under each flag
+- resample: padding the history and forward-filling it to one row per hour
+- week_bucketing: splitting the hourly data into terms and weeks
+- render: drawing and saving the calendar of the latest term
+
+Each stage is run once to time it and again under tracemalloc to measure its
+memory, as tracing slows the code down. eg:
+
+    python benchmark_pipeline.py --sizes 1000 100000 -o bench.json
+
+The sizes go up to a million changes by default. Larger ones can be asked for
+(eg --sizes 10000000 30000000 --no_memory) but 30 million needs more than 5 GB
+of memory.
+"""
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import matplotlib.pyplot as plt
+import pandas as pd
+
+from flag_history import load_flag_history, pad_history, resample_hourly, \
+    split_terms
+from flag_plot import RENDERERS, format_axes
+from flag_stats import get_peak_term_percentages
+from flag_store import FlagStore
+from flag_text import LabelCache, use_text
+from synthetic_history import END, START, generate_history, write_history
+from term_calendar import get_terms
+
+# Render off-screen
+plt.switch_backend('Agg')
+
+STAGES = [
+    'load_csv', 'migrate', 'load_sidecar', 'append', 'interval_stats',
+    'resample', 'week_bucketing', 'render',
+]
+# The number of changes of flag appended one at a time
+APPENDS = 100
+
+
+def measure(func, memory=True):
+    """
+    Get the time taken by a function (in s), the most memory that it
+    allocated at once (in bytes, or None) and its result.
+    """
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    peak = None
+    if memory:
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return seconds, peak, result
+
+
+def append_changes(store, n=APPENDS):
+    """Append changes of flag an hour apart after the last one."""
+    last = pd.Timestamp(store.last_set_date(), tz='UTC')
+    flags = ['Green', 'Amber']
+    for i in range(n):
+        set_date = last + pd.Timedelta(hours=i + 1)
+        store.append({
+            'reach': 'isis',
+            'status': '',
+            'status_text': flags[i % 2],
+            'set_date': set_date.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'set_by': 'benchmark',
+        })
+
+
+def render(full_term, term_name, year, labels):
+    """Draw the calendar of a term and save it to memory."""
+    fig, ax = plt.subplots(figsize=(6, 4), dpi=141)
+    RENDERERS['grid'](ax, full_term, labels)
+    format_axes(ax, full_term, term_name, year)
+    fig.savefig(BytesIO(), format='png')
+    plt.close(fig)
+
+
+def benchmark(n, folder, seed=0, memory=True):
+    """Time each stage of the pipeline on a history of `n` changes."""
+    path = Path(folder, f'synthetic_{n}.csv')
+    write_history(generate_history(n, seed=seed), path, sidecar=False)
+    # The history covers whole terms up to its end
+    now = datetime.fromisoformat(END)
+    terms = get_terms(pd.Timestamp(START).year, until=now)
+    labels = LabelCache(Path(folder, 'labels.npz'))
+    store = FlagStore(path)
+
+    results = {}
+
+    def run(stage, func):
+        seconds, peak, result = measure(func, memory)
+        results[stage] = {'seconds': seconds, 'peak_bytes': peak}
+        return result
+
+    run('load_csv', lambda: load_flag_history(path))
+    run('migrate', store.migrate)
+    df = run('load_sidecar', lambda: load_flag_history(path))
+    run('append', lambda: append_changes(store))
+    run('interval_stats', lambda: get_peak_term_percentages(df, terms, now))
+    hourly = run(
+        'resample', lambda: resample_hourly(pad_history(df, terms[-1], now))
+    )
+    full_terms = run('week_bucketing', lambda: split_terms(hourly, terms))
+    year, term_name, _, _ = terms[-1]
+    run('render', lambda: render(full_terms[-1], term_name, year, labels))
+
+    return results
+
+
+def print_table(all_results):
+    """Print the time and memory of each stage for each size of history."""
+    sizes = list(all_results)
+    print(f'{"Stage":<16}' + ''.join(f'{n:>20,}' for n in sizes))
+    for stage in STAGES:
+        row = f'{stage:<16}'
+        for n in sizes:
+            result = all_results[n][stage]
+            cell = f'{result["seconds"]:.3f}s'
+            if result['peak_bytes'] is not None:
+                cell += f' {result["peak_bytes"] / 2**20:7.1f}MB'
+            row += f'{cell:>20}'
+        print(row)
+
+
+if __name__ == '__main__':
+    # Create command-line argument parser
+    parser = argparse.ArgumentParser()
+    # Add optional arguments
+    parser.add_argument(
+        '--sizes', '-n', type=int, nargs='+',
+        default=[1000, 10000, 100000, 1000000],
+        help='the numbers of changes of flag in the histories (default: up '
+        'to a million)'
+    )
+    parser.add_argument('--seed', '-s', type=int, default=0)
+    parser.add_argument(
+        '--no_memory', action='store_true',
+        help='only time the stages, without measuring their memory'
+    )
+    parser.add_argument(
+        '--output', '-o', help='also save the results to a JSON file'
+    )
+    # Parse arguments from terminal
+    args = parser.parse_args()
+
+    # Use the same text rendering as analyse_flag_status.py --text mathtext
+    use_text('mathtext')
+    all_results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for n in args.sizes:
+            all_results[n] = benchmark(
+                n, folder, args.seed, not args.no_memory
+            )
+            seconds = sum(r['seconds'] for r in all_results[n].values())
+            print(f'{n:,} changes of flag: {seconds:.1f}s', flush=True)
+            # Do not keep every history on disk at once
+            for path in Path(folder).glob(f'synthetic_{n}.*'):
+                os.remove(path)
+    print_table(all_results)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({
+                'seed': args.seed,
+                'results': {str(n): r for n, r in all_results.items()},
+            }, file, indent=4)
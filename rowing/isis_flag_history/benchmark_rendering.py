@@ -0,0 +1,117 @@
+"""Compare the time taken by each way of drawing the Isis flag calendar."""
+import matplotlib.pyplot as plt
+from datetime import datetime, timezone
+from io import BytesIO
+import argparse
+import shutil
+import tempfile
+import time
+
+from flag_history import FIRST_YEAR, load_flag_history, pad_history, \
+    resample_hourly, split_terms
+from flag_plot import RENDERERS, format_axes, LABEL_SIZE, DATE_TEXTS, \
+    MONTH_TEXTS
+from flag_text import TEXT_MODES, LabelCache, use_text
+from term_calendar import get_terms
+
+# Render off-screen
+plt.switch_backend('Agg')
+
+# Create command-line argument parser
+parser = argparse.ArgumentParser()
+# Add optional arguments
+parser.add_argument('--path', '-p', default='master.csv')
+parser.add_argument('--repeats', '-n', type=int, default=3)
+parser.add_argument(
+    '--compare', '-c', choices=['renderers', 'text'], default='renderers',
+    help='compare the renderers or the ways of typesetting the text'
+)
+parser.add_argument('--usetex', action='store_true')
+# Parse arguments from terminal
+args = parser.parse_args()
+
+# Prepare the hourly data of every term that the history covers once
+df = load_flag_history(args.path)
+TERMS = get_terms(FIRST_YEAR, until=df['set_date'].max())
+df = pad_history(df, TERMS[-1], datetime.now(timezone.utc))
+df = resample_hourly(df)
+full_terms = split_terms(df, TERMS)
+
+
+def time_figure(full_term, term_name, year, draw, labels=None):
+    """Get the fastest of the repeats of drawing and saving a figure."""
+    best = float('inf')
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        fig, ax = plt.subplots(figsize=(6, 4), dpi=141)
+        draw(ax, full_term, labels)
+        format_axes(ax, full_term, term_name, year)
+        fig.savefig(BytesIO(), format='png')
+        plt.close(fig)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if args.compare == 'renderers':
+    if args.usetex:
+        # Use the same text rendering as analyse_flag_status.py
+        use_text('tex')
+
+    totals = {renderer: 0 for renderer in RENDERERS}
+    print(f'{"Term":<18}' + ''.join(f'{r:>12}' for r in RENDERERS))
+    for (year, term_name, _, _), full_term in zip(TERMS, full_terms):
+        row = f'{term_name + " " + year:<18}'
+        for renderer, draw in RENDERERS.items():
+            best = time_figure(full_term, term_name, year, draw)
+            totals[renderer] += best
+            row += f'{best:>11.3f}s'
+        print(row)
+    print(
+        f'{"Total":<18}' + ''.join(f'{t:>11.3f}s' for t in totals.values())
+    )
+    speed_up = totals['patches'] / totals['grid']
+    print(
+        f'The grid renderer is {speed_up:.1f}x faster than the patches '
+        'renderer'
+    )
+else:
+    # Each way of typesetting the text, with and without the label cache
+    modes = TEXT_MODES
+    if shutil.which('latex') is None:
+        print('LaTeX is not installed so only mathtext is timed')
+        modes = [mode for mode in modes if mode != 'tex']
+    configurations = []
+    for mode in modes:
+        configurations.append((mode, False))
+        configurations.append((mode, True))
+
+    print(f'{"Text":<18}{"Warm-up":>12}{"Per figure":>12}')
+    per_figure = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for mode, cached in configurations:
+            use_text(mode)
+            labels = None
+            warm_up = 0
+            if cached:
+                # Typeset the labels once, as the first ever run would
+                start = time.perf_counter()
+                labels = LabelCache(f'{folder}/{mode}.npz')
+                labels.warm(DATE_TEXTS + MONTH_TEXTS, LABEL_SIZE)
+                labels.save()
+                warm_up = time.perf_counter() - start
+            total = 0
+            for (year, term_name, _, _), full_term in zip(TERMS, full_terms):
+                total += time_figure(
+                    full_term, term_name, year, RENDERERS['grid'], labels
+                )
+            name = f'{mode} + cache' if cached else mode
+            per_figure[name] = total / len(TERMS)
+            print(
+                f'{name:<18}{warm_up:>11.3f}s{per_figure[name]:>11.3f}s'
+            )
+
+    # Compare each configuration with typesetting every label as text
+    baseline = list(per_figure)[0]
+    for name, seconds in list(per_figure.items())[1:]:
+        speed_up = per_figure[baseline] / seconds
+        print(f'{name} is {speed_up:.1f}x faster per figure than {baseline}')
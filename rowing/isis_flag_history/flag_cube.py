@@ -0,0 +1,185 @@
+"""
+Work out how likely each flag is at each hour of each week of term.
+
+Every hour of 0th to 9th Week of every term is looked up in the change points
+of the history at once (with a binary search) and the hours are counted by
+week, hour of the week and flag with a single `np.bincount`. The result is a
+cube of probabilities with axes:
+
+    0: the week of term (0 for 0th Week to 9 for 9th Week)
+    1: the hour of the week (0 for 00:00 on Sunday to 167 for 23:00 on
+       Saturday, in UTC)
+    2: the flag, in the order of `FLAGS`
+
+so that, eg, `cube[5, 24 + 6, FLAGS.index('Red')]` is the probability of a Red
+flag at 06:00 on the Monday of 5th Week. Hours before the history starts and
+hours after it ends (at the latest change of flag, or now) are not counted;
+hours that never were are NaN.
+
+Run this file to save the cube as a `.npy` file and draw it as a heatmap of
+each flag, eg:
+
+    python flag_cube.py --text mathtext
+"""
+from datetime import datetime, timezone
+import argparse
+import platform
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from matplotlib.colors import LinearSegmentedColormap, ListedColormap
+
+from flag_history import COLOURS, FLAGS, load_flag_history
+from flag_stats import get_change_points
+from flag_store import REACHES, get_reach_path
+from flag_text import TEXT_MODES, use_text
+from term_calendar import HOUR, get_boundaries, get_terms
+
+# 0th to 9th Week
+WEEKS = 10
+HOURS_PER_WEEK = 7 * 24
+
+
+def get_flag_counts(df, terms, now):
+    """
+    Count the hours of term under each flag by week and hour of the week.
+
+    `df` is the flag history (one row per change of flag). Returns an array of
+    shape (WEEKS, HOURS_PER_WEEK, len(FLAGS)); flags that are not in `FLAGS`
+    are not counted.
+    """
+    times, codes, flags = get_change_points(df)
+    counts = np.zeros((WEEKS, HOURS_PER_WEEK, len(FLAGS)), dtype=np.int64)
+    if len(times) == 0:
+        return counts
+    # The codes of the change points in the order of FLAGS
+    lookup = np.array([FLAGS.index(f) if f in FLAGS else -1 for f in flags])
+    codes = lookup[codes]
+
+    # Every hour of 0th to 9th Week of every term, one row per term
+    noughth_starts, _ = get_boundaries(terms)
+    slots = np.arange(WEEKS * HOURS_PER_WEEK)
+    hours = noughth_starts[:, None] + slots * HOUR
+    # The flag flying at the start of each hour
+    latest = np.searchsorted(times, hours, side='right') - 1
+    flag = codes[np.maximum(latest, 0)]
+    until = pd.Timestamp(now).value
+    counted = (latest >= 0) & (hours < until) & (flag >= 0)
+
+    # Encode each (week, hour of the week, flag) as one key and count them
+    keys = (np.broadcast_to(slots, hours.shape) * len(FLAGS) + flag)[counted]
+    counts += np.bincount(keys, minlength=counts.size).reshape(counts.shape)
+
+    return counts
+
+
+def get_flag_probabilities(counts):
+    """Get the probability of each flag from the counts of hours."""
+    totals = counts.sum(axis=-1, keepdims=True)
+    with np.errstate(invalid='ignore'):
+        return (counts / totals).astype(np.float32)
+
+
+def plot_flag_cube(path, cube, title):
+    """
+    Draw the probability of each flag by week and hour of the week, and the
+    most likely flag, with one heatmap each.
+    """
+    fig, axes = plt.subplots(
+        4, 2, figsize=(10, 10), dpi=141, sharex=True, sharey=True
+    )
+    extent = (-0.5, 6.5, WEEKS - 0.5, -0.5)
+    for i, (ax, flag) in enumerate(zip(axes.flat, FLAGS)):
+        cmap = LinearSegmentedColormap.from_list(
+            flag, ['white', COLOURS[flag]]
+        )
+        image = ax.imshow(
+            cube[:, :, i], cmap=cmap, vmin=0, vmax=1, extent=extent,
+            aspect='auto', interpolation='nearest'
+        )
+        ax.set_title(flag, fontsize=10)
+    fig.colorbar(image, ax=axes, shrink=0.5, label='Probability')
+
+    # The most likely flag at each hour
+    ax = axes.flat[len(FLAGS)]
+    counted = ~np.isnan(cube).any(axis=-1)
+    most_likely = np.ma.masked_where(
+        ~counted, np.argmax(np.nan_to_num(cube), axis=-1)
+    )
+    ax.imshow(
+        most_likely, cmap=ListedColormap([COLOURS[f] for f in FLAGS]),
+        vmin=-0.5, vmax=len(FLAGS) - 0.5, extent=extent, aspect='auto',
+        interpolation='nearest'
+    )
+    ax.set_title('Most likely', fontsize=10)
+
+    for ax in axes.flat:
+        ax.set_xticks(range(7))
+        ax.set_xticklabels(
+            ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat'], fontsize=8
+        )
+        ax.set_yticks(range(WEEKS))
+        ax.set_yticklabels([f'{week}' for week in range(WEEKS)], fontsize=8)
+    for ax in axes[:, 0]:
+        ax.set_ylabel('Week', fontsize=8)
+    fig.suptitle(title, fontsize=12)
+    fig.savefig(path)
+    plt.close(fig)
+
+
+if __name__ == '__main__':
+    if platform.system() == 'Linux':
+        # Set the Matplotlib backend to one that is compatible with Wayland
+        plt.switch_backend('Agg')
+
+    # Create command-line argument parser
+    parser = argparse.ArgumentParser()
+    # Add optional arguments
+    parser.add_argument('--reach', '-R', choices=REACHES, default='isis')
+    parser.add_argument('--folder', '-f', default='.')
+    parser.add_argument(
+        '--path', '-p', default=None,
+        help='change log to analyse instead of that of the reach'
+    )
+    parser.add_argument(
+        '--years', '-y', type=int, nargs='+', default=None,
+        help='first (and last) year of the terms to count (default: every '
+        'term of the history)'
+    )
+    parser.add_argument(
+        '--output', '-o', default=None,
+        help='name of the .npy and .png files, without the extension '
+        '(default: <reach>_flag_cube)'
+    )
+    parser.add_argument('--text', choices=TEXT_MODES, default='tex')
+    # Parse arguments from terminal
+    args = parser.parse_args()
+
+    history = load_flag_history(
+        args.path or get_reach_path(args.reach, args.folder)
+    )
+    # Count the hours up to the latest change of flag, so that the terms
+    # after the end of the history are not filled in with its last flag
+    until = min(datetime.now(timezone.utc), history['set_date'].max())
+    if args.years is None:
+        years = [history['set_date'].min().year, until.year]
+    else:
+        years = args.years
+    terms = get_terms(years[0], years[-1], until)
+    # Leave out the terms that ended before the history starts
+    _, ninth_ends = get_boundaries(terms)
+    first_change = history['set_date'].min().value
+    terms = [t for t, end in zip(terms, ninth_ends) if end >= first_change]
+    cube = get_flag_probabilities(get_flag_counts(history, terms, until))
+
+    output = args.output or f'{args.reach}_flag_cube'
+    np.save(f'{output}.npy', cube)
+    use_text(args.text)
+    first, last = terms[0], terms[-1]
+    title = (
+        f'OURCs {args.reach.title()} Flag, {first[1]} {first[0]} to '
+        f'{last[1]} {last[0]}'
+    )
+    plot_flag_cube(f'{output}.png', cube, title)
+    print(f'Wrote {output}.npy and {output}.png')
@@ -0,0 +1,140 @@
+"""Load and prepare the Isis flag history for analysis."""
+from datetime import datetime, timedelta
+import csv
+
+import numpy as np
+import pandas as pd
+
+from flag_store import FlagStore
+from term_calendar import get_ninth_end, get_boundaries, locate
+
+# Matplotlib colours for each flag
+COLOURS = {
+    'Black': '#212121',
+    'Red': '#E74C3C',
+    'Amber': '#F0B23E',
+    'Dark Blue': '#1C71A6',
+    'Light Blue': 'lightblue',
+    'Green': '#70A35E',
+    'Grey': 'grey',
+}
+# The flags in the order in which they are reported
+FLAGS = list(COLOURS)
+
+# The first year to analyse by default
+FIRST_YEAR = 2023
+
+
+def load_terms(path):
+    """
+    Import a table of terms from a CSV file.
+
+    The file has a column for each part of a term's description: year, term,
+    noughth_start (the first day of 0th Week) and peak_term_end (the last hour
+    of Peak Term).
+    """
+    with open(path, newline='') as file:
+        reader = csv.DictReader(file)
+        return [
+            (row['year'], row['term'], row['noughth_start'],
+             row['peak_term_end'])
+            for row in reader
+        ]
+
+
+def load_flag_history(path, start=None):
+    """
+    Import the flag history and add the Matplotlib colour of each flag.
+
+    If the binary sidecar of the CSV file is up to date then only the changes
+    from `start` onwards (plus the one flying at `start`) are loaded from it.
+    """
+    store = FlagStore(path)
+    if store.has_sidecar():
+        df = store.load(start=start)
+    else:
+        df = pd.read_csv(path)
+        # Trim
+        cols = ['status_text', 'set_date']
+        df = df[cols].copy()
+        # Convert 'set_date' column to datetime objects
+        df['set_date'] = pd.to_datetime(df['set_date'], format='ISO8601')
+    # Convert colours to Matplotlib colours
+    status_text = df['status_text'].astype('category')
+    df['colour'] = status_text.cat.rename_categories(
+        lambda flag: COLOURS.get(flag, flag)
+    )
+
+    return df
+
+
+def get_last_set_date(path):
+    """Get the time of the latest change of flag in the history."""
+    store = FlagStore(path)
+    if store.has_sidecar() and len(store):
+        return pd.Timestamp(store.last_set_date(), tz='UTC')
+    set_date = pd.read_csv(path, usecols=['set_date'])['set_date']
+    return pd.to_datetime(set_date, format='ISO8601', utc=True).max()
+
+
+def pad_history(df, latest_term, now):
+    """
+    Pad the history with placeholder ("white") flags.
+
+    The padding runs to either now or the end of 9th Week of the latest term,
+    whichever is later, so that the forward fill covers the whole term.
+    """
+    # First day of 0th week
+    noughth_start = datetime.fromisoformat(latest_term[2])
+    # End of 9th week
+    ninth_end = get_ninth_end(noughth_start)
+    if now > ninth_end:
+        # If it is currently vacation time (ie after the end of the latest
+        # term)
+        new_rows = [
+            {'set_date': ninth_end + timedelta(hours=1), 'colour': 'white'},
+            {'set_date': now, 'colour': 'white'},
+        ]
+    else:
+        # If it is currently term time (ie before the end of the latest term)
+        new_rows = [
+            {'set_date': now, 'colour': 'white'},
+            {'set_date': ninth_end, 'colour': 'white'},
+        ]
+    new_rows = pd.DataFrame(new_rows)
+
+    return pd.concat([df, new_rows], ignore_index=True)
+
+
+def resample_hourly(df):
+    """Forward-fill the gaps in the data so that there is one row per hour."""
+    df = df.rename(columns={'set_date': 'datetime'})
+    df = df.set_index('datetime')
+    df = df.resample('1h').ffill()
+    df.reset_index(inplace=True)
+
+    return df
+
+
+def split_terms(df, terms):
+    """
+    Extract 0th to 9th Week of each of the terms from the hourly data.
+
+    The hourly data is sorted, so each term's rows are found with a binary
+    search, and the week numbers of all of the rows are found at once.
+    """
+    datetimes = df['datetime']
+    _, weeks, _, _ = locate(datetimes, terms)
+    noughth_starts, ninth_ends = get_boundaries(terms)
+    times = datetimes.to_numpy('datetime64[ns]').view(np.int64)
+    first = np.searchsorted(times, noughth_starts, side='left')
+    last = np.searchsorted(times, ninth_ends, side='right')
+
+    full_terms = []
+    for i, j in zip(first, last):
+        full_term = df.iloc[i:j].copy()
+        # The number of weeks since the start of 0th week
+        full_term['oxford_week_number'] = weeks[i:j]
+        full_terms.append(full_term)
+
+    return full_terms
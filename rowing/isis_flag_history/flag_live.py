@@ -0,0 +1,236 @@
+"""
+Update the calendar of the term so far without drawing it all again.
+
+During term the calendar only changes where new hours have been recorded, so
+instead of drawing the whole figure on every run, it is drawn once as two
+layers:
+
+- which pixels of the image each hour's cell of the grid covers
+- everything else (the axes, the title and the dates and months), over a
+  transparent background
+
+These are saved (compressed) to a state file in STATE_DIR, next to the
+calendar, along with the image, the colour of each cell and the time of the
+last update. Later runs only forward-fill the hours since the last update
+(see `get_new_hours`), recolour only the pixels of the cells whose flag has
+changed, blend the rest of the figure back over them and save the image,
+which takes milliseconds instead of the time taken to resample the term and
+to draw and typeset the figure. The layers are drawn again whenever the
+state no longer matches the term or the way that it is drawn.
+"""
+from pathlib import Path
+import json
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.colors import ListedColormap, to_rgba_array
+from PIL import Image
+
+from flag_history import pad_history, resample_hourly, split_terms
+from flag_plot import draw_grid, format_axes, get_grid_cells
+from flag_stats import HOUR
+from flag_text import get_fingerprint
+from flag_timing import StageLog
+
+# Change this when the state or the figure changes so that old states are
+# drawn again
+STATE_VERSION = 2
+# The folder (next to the calendars) that the states are kept in
+STATE_DIR = '.flag_state'
+# The number of cells in each row (week) of the grid
+CELLS_PER_WEEK = 7 * 24
+# The colour of the cells with no data
+WHITE = np.array([255, 255, 255, 255], dtype=np.uint8)
+
+
+def get_state_path(path):
+    """Get the state file of a calendar."""
+    path = Path(path)
+    return Path(path.parent, STATE_DIR, path.stem + '.state.npz')
+
+
+def get_state_key(term, reach, labels):
+    """Describe everything that the layers of a calendar depend on."""
+    return json.dumps([
+        STATE_VERSION, *term, reach, get_fingerprint(), labels,
+    ])
+
+
+def get_cell_colours(full_term, first_week):
+    """Get the cell of the grid and the colour (RGBA, 0-255) of each hour."""
+    weeks, cols = get_grid_cells(full_term)
+    cells = (weeks - first_week) * CELLS_PER_WEEK + cols
+    codes, uniques = pd.factorize(full_term['colour'])
+    # Convert the colours in the same way as the colour map of the grid
+    palette = (to_rgba_array(list(uniques)) * 255).astype(np.uint8)
+
+    return cells, palette[codes]
+
+
+def render(fig):
+    """Draw a figure and get its pixels (RGBA, 0-255)."""
+    canvas = FigureCanvasAgg(fig)
+    canvas.draw()
+    return np.asarray(canvas.buffer_rgba()).copy()
+
+
+def draw_layers(full_term, term_name, year, reach='isis', labels=None):
+    """
+    Draw a term's calendar as layers.
+
+    Returns the cell that each pixel shows (-1 for none) and the pixels of
+    the rest of the figure, over a transparent background.
+    """
+    fig, ax = plt.subplots(figsize=(6, 4), dpi=141)
+    draw_grid(ax, full_term, labels)
+    format_axes(ax, full_term, term_name, year, reach)
+    grid = ax.images[0]
+    shape = grid.get_array().shape
+
+    # Draw the grid on its own, with each cell in a colour that encodes its
+    # index, to find the pixels that it covers
+    probe, probe_ax = plt.subplots(figsize=(6, 4), dpi=141)
+    probe.patch.set_alpha(0)
+    probe_ax.set_position(ax.get_position())
+    probe_ax.set_axis_off()
+    index = np.arange(shape[0] * shape[1])
+    lut = np.zeros((index.size, 4))
+    # Base 255, aiming for the middle of each level so that rounding cannot
+    # change it
+    lut[:, 0] = (index % 255 + 0.5) / 255
+    lut[:, 1] = (index // 255 + 0.5) / 255
+    lut[:, 3] = 1
+    probe_ax.imshow(
+        index.reshape(shape), cmap=ListedColormap(lut), vmin=-0.5,
+        vmax=index.size - 0.5, extent=grid.get_extent(), origin='upper',
+        aspect='auto', interpolation='nearest'
+    )
+    probe_ax.set_xlim(ax.get_xlim())
+    probe_ax.set_ylim(ax.get_ylim())
+    pixels = render(probe).astype(np.int32)
+    plt.close(probe)
+    cell_map = pixels[..., 0] + 255 * pixels[..., 1]
+    # Pixels that are only partly covered by the grid (at its edges) are not
+    # cells
+    cell_map[pixels[..., 3] < 255] = -1
+
+    # Draw everything else over a transparent background
+    grid.set_visible(False)
+    fig.patch.set_alpha(0)
+    ax.patch.set_alpha(0)
+    overlay = render(fig)
+    plt.close(fig)
+
+    return cell_map, overlay
+
+
+def blend(overlay, under):
+    """Blend pixels (RGBA) over opaque pixels (RGB)."""
+    alpha = overlay[..., 3:] / 255
+    blended = overlay[..., :3] * alpha + under * (1 - alpha)
+    return np.rint(blended).astype(np.uint8)
+
+
+def load_state(path, key, names=None):
+    """
+    Load the state of a calendar (or some of its arrays), or None if it does
+    not match the key or the calendar is missing.
+    """
+    state_path = get_state_path(path)
+    if not (state_path.exists() and Path(path).exists()):
+        return None
+    with np.load(state_path) as data:
+        if str(data['key']) != key or 'last' not in data.files:
+            return None
+        return {name: data[name] for name in names or data.files}
+
+
+def get_new_hours(path, history, term, now, reach='isis', labels=False):
+    """
+    Forward-fill the hours of a term that a calendar has not been updated
+    with: those from its last update onwards, or every hour of the term (with
+    week numbers) if it has to be drawn again.
+
+    `history` is the flag history (one row per change of flag) and `labels`
+    is whether the calendar uses the label cache.
+    """
+    key = get_state_key(term, reach, labels)
+    state = load_state(path, key, ['key', 'last'])
+    if state is not None:
+        last = int(state['last']) // HOUR * HOUR
+        # The changes since the last update, and the flag flying then
+        times = history['set_date'].to_numpy('datetime64[ns]').view(np.int64)
+        i = np.searchsorted(times, last, side='right') - 1
+        history = history.iloc[max(i, 0):]
+    df = pad_history(history, term, now)
+    df = resample_hourly(df)
+    full_term = split_terms(df, [term])[0]
+    if state is not None:
+        since = pd.Timestamp(last, tz='UTC')
+        full_term = full_term[full_term['datetime'] >= since]
+
+    return full_term
+
+
+def update_term(path, full_term, term, reach='isis', labels=None, now=None,
+                log=None):
+    """
+    Draw the calendar of a term to a file, recolouring only the cells of the
+    hours in `full_term` that have changed since it was last drawn.
+
+    `full_term` must be every hour of the term unless the calendar has a
+    state that is up to date (see `get_new_hours`). Returns the number of
+    cells that were recoloured.
+    """
+    log = log or StageLog()
+    year, term_name = term[:2]
+    path = Path(path)
+    state_path = get_state_path(path)
+    key = get_state_key(term, reach, labels is not None)
+    state = load_state(path, key)
+    if state is None:
+        with log.stage('draw_layers', rows=len(full_term)):
+            cell_map, overlay = draw_layers(
+                full_term, term_name, year, reach, labels
+            )
+            n_cells = cell_map.max() + 1
+            state = {
+                'key': np.array(key),
+                'first_week': np.int64(full_term['oxford_week_number'].min()),
+                'cell_map': cell_map.astype(np.int16),
+                'overlay': overlay,
+                'colours': np.tile(WHITE, (n_cells, 1)),
+                # Every cell starts off white
+                'image': blend(overlay, WHITE[:3]),
+            }
+
+    with log.stage('update') as record:
+        colours = state['colours'].copy()
+        cells, cell_colours = get_cell_colours(
+            full_term, int(state['first_week'])
+        )
+        colours[cells] = cell_colours
+        changed = np.flatnonzero((colours != state['colours']).any(axis=1))
+        image = state['image']
+        if changed.size:
+            pixels = np.isin(state['cell_map'], changed)
+            under = colours[state['cell_map'][pixels], :3]
+            image[pixels] = blend(state['overlay'][pixels], under)
+        Image.fromarray(image).save(path, dpi=(141, 141))
+        record['cells'] = int(changed.size)
+
+    state['colours'] = colours
+    state['image'] = image
+    # Hours from now onwards are filled in again next time
+    now = pd.Timestamp.now('UTC') if now is None else pd.Timestamp(now)
+    state['last'] = np.int64(now.value)
+    # Write to a temporary file first so that the state is never left
+    # half-written
+    state_path.parent.mkdir(exist_ok=True)
+    temporary = state_path.with_name(state_path.name + '.tmp.npz')
+    np.savez_compressed(temporary, **state)
+    temporary.replace(state_path)
+
+    return int(changed.size)
@@ -0,0 +1,237 @@
+"""
+Model the changes of flag as a Markov chain and forecast the rest of a term.
+
+The history is treated as a series of stays under one flag. Each stay lasts
+for a dwell time and ends with a change to a different flag, and both depend
+on the time of year: the chance of each change of flag and the dwell times
+are estimated separately for each month, from the changes that were made in
+that month. Months with few changes borrow from the whole year, so that every
+flag that has ever flown can change to every flag that it has ever changed
+to.
+
+The model is estimated by counting, with `np.bincount`, and forecasts are
+made by simulating many trajectories at once as arrays: each step changes the
+flag of every trajectory that has not yet reached the end of the forecast,
+and the hours that each stay covers are added up with a running sum. The
+trajectories can also be split between several processes.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+
+from flag_history import FLAGS
+from flag_stats import HOUR, get_change_points
+
+# The months of the year, plus the whole year
+MONTHS = 12
+YEAR = MONTHS
+# The weight of the whole year's changes of flag in each month's (as a
+# number of changes)
+PRIOR_WEIGHT = 1.0
+# The shortest stay under a flag (in hours)
+MIN_DWELL = 1 / 60
+
+
+def get_months(times):
+    """Get the month (0 for January) of times in ns since the epoch."""
+    return np.asarray(times, dtype='datetime64[ns]').astype(
+        'datetime64[M]'
+    ).astype(np.int64) % MONTHS
+
+
+def get_stays(df):
+    """
+    Get the stays under each flag from the flag history.
+
+    Returns the flag (the index in FLAGS) and start (in ns since the epoch)
+    of each stay and the dwell time (in hours) of all but the last one, which
+    is still going on. Changes to the same flag, and flags that are not in
+    FLAGS, are left out.
+    """
+    times, codes, flags = get_change_points(df)
+    lookup = np.array([FLAGS.index(f) if f in FLAGS else -1 for f in flags])
+    codes = lookup[codes] if len(codes) else codes
+    known = codes >= 0
+    times, codes = times[known], codes[known]
+    # Only the first of each run of the same flag starts a stay
+    new = np.append(True, codes[1:] != codes[:-1])
+    times, codes = times[new], codes[new]
+    dwells = np.diff(times) / HOUR
+
+    return codes, times, dwells
+
+
+class FlagModel:
+    """
+    The chance of each change of flag and the dwell times under each flag,
+    for each month of the year.
+
+    `transitions[m, i, j]` is the chance that a stay under flag i that ends
+    in month m is followed by one under flag j. The dwell times of the stays
+    under flag i that started in month m are `dwells[starts[m, i]:][:counts[m,
+    i]]`, sorted; month YEAR is the whole year.
+    """
+
+    def __init__(self, transitions, dwells, starts, counts):
+        self.transitions = transitions
+        self.cumulative = np.cumsum(transitions, axis=-1)
+        self.dwells = dwells
+        self.starts = starts
+        self.counts = counts
+
+    @classmethod
+    def estimate(cls, df):
+        """Estimate the model from the flag history."""
+        k = len(FLAGS)
+        codes, times, dwells = get_stays(df)
+        before, after = codes[:-1], codes[1:]
+        # Changes of flag are counted in the month that they were made
+        months = get_months(times[1:])
+        counts = np.bincount(
+            (months * k + before) * k + after, minlength=MONTHS * k * k
+        ).reshape(MONTHS, k, k).astype(float)
+        year = counts.sum(axis=0)
+        # Each month borrows from the whole year
+        totals = year.sum(axis=-1, keepdims=True)
+        with np.errstate(invalid='ignore'):
+            prior = np.where(totals > 0, year / totals, 0)
+        counts = counts + PRIOR_WEIGHT * prior
+        counts = np.concatenate([counts, year[None]])
+        # Flags that have never changed stay as they are
+        totals = counts.sum(axis=-1, keepdims=True)
+        stay = np.broadcast_to(np.eye(k), counts.shape)
+        with np.errstate(invalid='ignore'):
+            transitions = np.where(totals > 0, counts / totals, stay)
+
+        # Dwell times, sorted by the month in which the stay started and the
+        # flag, and then by length
+        flags = codes[:-1]
+        months = get_months(times[:-1])
+        order = np.lexsort((dwells, flags, months))
+        by_month = np.bincount(
+            months * k + flags, minlength=MONTHS * k
+        ).reshape(MONTHS, k)
+        order = np.concatenate([order, np.lexsort((dwells, flags))])
+        by_year = np.bincount(flags, minlength=k)
+        sizes = np.concatenate([by_month, by_year[None]])
+        starts = np.cumsum(sizes.ravel()) - sizes.ravel()
+        starts = starts.reshape(sizes.shape)
+        # Months with no stays under a flag use those of the whole year
+        empty = sizes == 0
+        starts = np.where(empty, starts[YEAR], starts)
+        sizes = np.where(empty, sizes[YEAR], sizes)
+
+        return cls(transitions, dwells[order], starts, sizes)
+
+    def sample_dwells(self, months, flags, rng):
+        """Sample a dwell time (in hours) for each of some stays."""
+        counts = self.counts[months, flags]
+        i = self.starts[months, flags] + (
+            rng.random(len(flags)) * counts
+        ).astype(np.int64)
+        # Flags that have never changed stay for ever
+        dwells = np.full(len(flags), np.inf)
+        known = counts > 0
+        dwells[known] = self.dwells[i[known]]
+        return np.maximum(dwells, MIN_DWELL)
+
+    def sample_remaining(self, month, flag, age, n, rng):
+        """
+        Sample the rest of a stay under a flag that has lasted `age` hours so
+        far, from the stays that lasted longer than that.
+        """
+        start = self.starts[month, flag]
+        dwells = self.dwells[start:start + self.counts[month, flag]]
+        longer = dwells[np.searchsorted(dwells, age, side='right'):]
+        if len(longer) == 0:
+            # No stay has lasted this long, so start a new one
+            months = np.full(n, month)
+            return self.sample_dwells(months, np.full(n, flag), rng)
+        remaining = longer[rng.integers(len(longer), size=n)] - age
+        return np.maximum(remaining, MIN_DWELL)
+
+    def sample_changes(self, months, flags, rng):
+        """Sample the next flag of each of some stays."""
+        cumulative = self.cumulative[months, flags]
+        u = rng.random(len(flags))[:, None]
+        changes = (u > cumulative).sum(axis=1)
+        return np.minimum(changes, len(FLAGS) - 1)
+
+
+def simulate(model, flag, age, start, hours, n, seed=None):
+    """
+    Simulate `n` trajectories of the flag from `start` (ns since the epoch),
+    under a flag that has flown for `age` hours by then.
+
+    Returns the number of trajectories under each flag at the start of each
+    of the next `hours` hours, as an array of shape (hours, len(FLAGS)).
+    """
+    k = len(FLAGS)
+    rng = np.random.default_rng(seed)
+    # The time (in hours since `start`) at which each stay starts and ends
+    begin = np.zeros(n)
+    flags = np.full(n, flag)
+    end = model.sample_remaining(get_months([start])[0], flag, age, n, rng)
+    # Stays add one to their flag from their first hour and take it away
+    # after their last
+    changes = np.zeros((hours + 1) * k, dtype=np.int64)
+    while len(flags):
+        first = np.ceil(begin).astype(np.int64)
+        last = np.minimum(np.ceil(np.minimum(end, hours)), hours)
+        last = last.astype(np.int64)
+        changes += np.bincount(first * k + flags, minlength=changes.size)
+        changes -= np.bincount(last * k + flags, minlength=changes.size)
+        # Carry on with the trajectories that have not finished
+        going = end < hours
+        begin = end[going]
+        months = get_months(start + (begin * HOUR).astype(np.int64))
+        flags = model.sample_changes(months, flags[going], rng)
+        end = begin + model.sample_dwells(months, flags, rng)
+
+    return np.cumsum(changes.reshape(hours + 1, k), axis=0)[:hours]
+
+
+def _simulate(arguments):
+    return simulate(*arguments)
+
+
+def forecast(model, flag, age, start, hours, n=20000, seed=None, jobs=1):
+    """
+    Forecast the probability of each flag at the start of each of the next
+    `hours` hours.
+
+    The trajectories are split between `jobs` processes (forked, where that
+    is possible), each with its own stream of random numbers.
+    """
+    jobs = max(1, min(jobs, n))
+    sizes = [len(batch) for batch in np.array_split(np.arange(n), jobs)]
+    seeds = np.random.SeedSequence(seed).spawn(jobs)
+    tasks = [
+        (model, flag, age, start, hours, size, seed)
+        for size, seed in zip(sizes, seeds)
+    ]
+    if jobs == 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        counts = [_simulate(task) for task in tasks]
+    else:
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(
+            max_workers=min(jobs, os.cpu_count() or 1), mp_context=context
+        ) as executor:
+            counts = list(executor.map(_simulate, tasks))
+
+    return sum(counts) / n
+
+
+def get_current_stay(df, now):
+    """
+    Get the flag (the index in FLAGS) that is flying now and how long it has
+    been flying for (in hours).
+    """
+    codes, times, _ = get_stays(df)
+    i = np.searchsorted(times, pd.Timestamp(now).value, side='right') - 1
+    if i < 0:
+        raise ValueError('The history starts after the forecast')
+    return int(codes[i]), (pd.Timestamp(now).value - times[i]) / HOUR
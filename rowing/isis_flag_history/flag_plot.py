@@ -0,0 +1,256 @@
+"""Draw the calendar of Isis flags for one term."""
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
+from matplotlib.colors import ListedColormap
+
+# Each hour is drawn as a block this wide (in days) and tall (in weeks)
+WIDTH = 1 / 24
+HEIGHT = 1
+# The hour of the day in whose block the date is written
+DATE_HOUR = 21
+# The font size of the dates and months
+LABEL_SIZE = 6
+# The labels that can be written in the blocks
+DATE_TEXTS = [str(day) for day in range(1, 32)]
+MONTH_TEXTS = [
+    'January', 'February', 'March', 'April', 'May', 'June', 'July', 'August',
+    'September', 'October', 'November', 'December',
+]
+
+
+def cardinal_to_ordinal(cardinal):
+    """Convert a cordinal number to an ordinal number."""
+    if cardinal % 10 == 1:
+        return f'{cardinal}st'
+    elif cardinal % 10 == 2:
+        return f'{cardinal}nd'
+    elif cardinal % 10 == 3:
+        return f'{cardinal}rd'
+    else:
+        return f'{cardinal}th'
+
+
+def add_date_text(ax, x, y, date_text, labels=None):
+    """
+    Add the day of the month as text in an hour's block.
+
+    If a label cache is given, the label is drawn from its cached outline.
+    """
+    if labels is not None:
+        add_date_texts(ax, [x], [y], [date_text], labels)
+        return
+    ax.text(
+        # Align text horizontally in the rectangle
+        x + WIDTH / 2,
+        # Align text vertically in the rectangle
+        y + HEIGHT / 1.3,
+        # The date as text
+        date_text,
+        # Horizontal alignment
+        ha='center',
+        # Vertical alignment
+        va='center',
+        # Font size
+        fontsize=LABEL_SIZE,
+        # Text color
+        color='w'
+    )
+
+
+def add_month_text(ax, x, y, month_text, labels=None):
+    """
+    Add the name of the month as text in an hour's block.
+
+    If a label cache is given, the label is drawn from its cached outline.
+    """
+    if labels is not None:
+        add_month_texts(ax, [x], [y], [month_text], labels)
+        return
+    ax.text(
+        # Align text horizontally in the rectangle
+        x + WIDTH / 2,
+        # Align text vertically in the rectangle
+        y + HEIGHT / 3.5,
+        # The month as text
+        month_text,
+        # Vertical alignment
+        va='center',
+        # Font size
+        fontsize=LABEL_SIZE,
+        # Text color
+        color='w',
+    )
+
+
+def add_date_texts(ax, x, y, date_texts, labels=None):
+    """
+    Add the days of the month as text in hours' blocks.
+
+    If a label cache is given, the labels are drawn from their cached
+    outlines, all at once.
+    """
+    if labels is None:
+        for x_i, y_i, date_text in zip(x, y, date_texts):
+            add_date_text(ax, x_i, y_i, date_text)
+        return
+    labels.draw(
+        ax, np.asarray(x) + WIDTH / 2, np.asarray(y) + HEIGHT / 1.3,
+        list(date_texts), LABEL_SIZE, 'w', ha='center', va='center'
+    )
+
+
+def add_month_texts(ax, x, y, month_texts, labels=None):
+    """
+    Add the names of the months as text in hours' blocks.
+
+    If a label cache is given, the labels are drawn from their cached
+    outlines, all at once.
+    """
+    if labels is None:
+        for x_i, y_i, month_text in zip(x, y, month_texts):
+            add_month_text(ax, x_i, y_i, month_text)
+        return
+    labels.draw(
+        ax, np.asarray(x) + WIDTH / 2, np.asarray(y) + HEIGHT / 3.5,
+        list(month_texts), LABEL_SIZE, 'w', va='center'
+    )
+
+
+def draw_patches(ax, full_term, labels=None):
+    """Draw each hour of the term as its own rectangle."""
+    # Create a flag to indicate if we need to add the month in the first block
+    month_in_first_block = True
+    # Loop through each week
+    for week_number, week_data in full_term.groupby('oxford_week_number'):
+        # Plot rectangles for each hour
+        for _, row in week_data.iterrows():
+            # Convert datetime to days-since-epoch
+            x = mdates.date2num(row['datetime'])
+            # 1970-01-01 was a Thursday, so subtract 3 days to pretend it was a
+            # Monday (which we will label as "Sunday")
+            x = x - 3
+            # Get only the fractions of the week
+            x = x % 7
+            # Plot the week number on the y-axis
+            y = week_number
+            # Plot with an offset so as to align with the centre of the labels
+            x = x - 0.5
+            y = y - 0.5
+
+            # Plot the rectangle
+            rect = plt.Rectangle((x, y), WIDTH, HEIGHT, color=row['colour'])
+            ax.add_patch(rect)
+
+            # Add the date as text in one rectangle each day
+            if row['datetime'].hour == DATE_HOUR:
+                date_text = row['datetime'].strftime('%d').lstrip('0')
+                add_date_text(ax, x, y, date_text, labels)
+
+            # Add the month name as text in the relevant rectangles
+            if (row['datetime'].day == 1 or month_in_first_block):
+                if row['datetime'].hour == 1:
+                    month_text = row['datetime'].strftime('%B')
+                    add_month_text(ax, x, y, month_text, labels)
+                    month_in_first_block = False
+
+
+def get_grid_cells(full_term):
+    """
+    Get the week (the row of the grid) and the hour of the week (the column)
+    of each of a term's hours.
+    """
+    datetimes = full_term['datetime']
+    # Hours since the epoch. 1970-01-01 was a Thursday, so subtract 3 days to
+    # pretend it was a Monday (which we will label as "Sunday")
+    epoch = pd.Timestamp('1970-01-01', tz=datetimes.dt.tz)
+    hours = (datetimes - epoch) // pd.Timedelta(hours=1) - 3 * 24
+    hours = hours.to_numpy()
+    weeks = full_term['oxford_week_number'].to_numpy().astype(int)
+
+    return weeks, hours % (7 * 24)
+
+
+def draw_grid(ax, full_term, labels=None):
+    """Draw the whole term as one image with a pixel for each hour."""
+    datetimes = full_term['datetime']
+    # Each row of the grid is a week and each column is an hour of that week
+    weeks, cols = get_grid_cells(full_term)
+    start_week = weeks.min()
+    end_week = weeks.max()
+    rows = weeks - start_week
+
+    # Encode each colour as an index into a colour map
+    codes, uniques = pd.factorize(full_term['colour'])
+    grid = np.full((end_week - start_week + 1, 7 * 24), -1)
+    grid[rows, cols] = codes
+    # Hours with no data are left transparent
+    grid = np.ma.masked_less(grid, 0)
+    cmap = ListedColormap(list(uniques))
+    ax.imshow(
+        grid, cmap=cmap, vmin=-0.5, vmax=len(uniques) - 0.5,
+        extent=(-0.5, 6.5, end_week + 0.5, start_week - 0.5),
+        origin='upper', aspect='auto', interpolation='nearest'
+    )
+
+    # Positions of the blocks, offset so as to align with the centre of the
+    # labels
+    x = cols / 24 - 0.5
+    y = weeks - 0.5
+
+    # Add the date as text in one block each day
+    bl = (datetimes.dt.hour == DATE_HOUR).to_numpy()
+    date_texts = datetimes[bl].dt.strftime('%d').str.lstrip('0')
+    add_date_texts(ax, x[bl], y[bl], date_texts, labels)
+
+    # Add the month name as text at 01:00 on the 1st of each month and in the
+    # first block
+    first_hours = (datetimes.dt.hour == 1).to_numpy()
+    first_block = first_hours & (np.cumsum(first_hours) == 1)
+    bl = first_hours & ((datetimes.dt.day == 1).to_numpy() | first_block)
+    month_texts = datetimes[bl].dt.strftime('%B')
+    add_month_texts(ax, x[bl], y[bl], month_texts, labels)
+
+
+# The available ways of drawing the hours of a term
+RENDERERS = {
+    'grid': draw_grid,
+    'patches': draw_patches,
+}
+
+
+def format_axes(ax, full_term, term_name, year, reach='isis'):
+    """Label the days, weeks and title of a term's calendar."""
+    # Construct the x-axis so as to represent days of the week
+    ax.set_xticks(range(7))
+    labels = ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat']
+    ax.set_xticklabels(labels, fontsize=8)
+    ax.set_xlim(-0.5, 6.5)
+    # Remove black lines on the major x-axis ticks
+    ax.tick_params(axis='x', which='major', length=0)
+    # Add minor ticks on the x-axis without labels
+    ax.set_xticks([i + 0.5 for i in range(7)], minor=True)
+    # Add grid lines
+    ax.grid(axis='x', which='minor', linestyle='-')
+
+    # Construct the y-axis so as to represent weeks
+    start_week = int(full_term['oxford_week_number'].min())
+    end_week = int(full_term['oxford_week_number'].max())
+    num_weeks = end_week - start_week + 1
+    ax.set_ylim(end_week + 0.5, start_week - 0.5)
+    ax.set_yticks(range(start_week, end_week + 1))
+    # Construct the week names
+    week_names = [f'{cardinal_to_ordinal(i)} Week' for i in range(num_weeks)]
+    ax.set_yticklabels(week_names, fontsize=8)
+    # Remove black lines on the major y-axis ticks
+    ax.tick_params(axis='y', which='major', length=0)
+    # Add minor ticks on y-axis without labels
+    ax.set_yticks([i + 0.5 for i in range(num_weeks)], minor=True)
+    # Add grid lines
+    ax.grid(axis='y', which='minor', linestyle='-')
+
+    # Set title and labels
+    st = f"""OURCs {reach.title()} Flag
+    {term_name} Term {year}"""
+    ax.set_title(st, fontsize=12)
@@ -0,0 +1,287 @@
+"""
+Poll the Isis flag status API from a long-running process.
+
+Rather than starting a new process (and a new connection) for every check, the
+poller keeps one pooled HTTP session open and asks the API for the status at a
+fixed interval. The requests are conditional - they carry the ETag and
+Last-Modified values of the previous response - so that an unchanged status
+costs a "304 Not Modified" with no body, where the API supports it. Failed
+polls are retried after an exponentially growing, randomly jittered delay.
+
+Only real changes of flag (ie new `set_date` values) are written to the data
+store, and the time taken by each poll is recorded so that statistics of the
+latency can be reported.
+
+Several reaches can be polled from the same process: their pollers share one
+session and a semaphore that limits how many requests are in flight at once.
+"""
+from collections import deque
+from contextlib import nullcontext
+import asyncio
+import random
+import signal
+import sys
+import time
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from flag_store import FlagStore, get_reach_path, to_nanoseconds
+
+# The status of each reach is at this URL, with {reach} filled in
+URL = 'https://ourcs.co.uk/api/flags/status/{reach}/'
+
+
+class PollStats:
+    """Counts of the outcomes of polls and the latencies of recent ones."""
+
+    def __init__(self, name='', window=1000):
+        self.name = name
+        # Latencies (in seconds) of the most recent polls
+        self.latencies = deque(maxlen=window)
+        self.polls = 0
+        self.not_modified = 0
+        self.unchanged = 0
+        self.changes = 0
+        self.errors = 0
+
+    def record(self, latency):
+        """Record the latency of a poll."""
+        self.polls += 1
+        self.latencies.append(latency)
+
+    def summary(self):
+        """Get the counts and the latency percentiles (in ms)."""
+        summary = {
+            'polls': self.polls,
+            'not_modified': self.not_modified,
+            'unchanged': self.unchanged,
+            'changes': self.changes,
+            'errors': self.errors,
+        }
+        if self.latencies:
+            latencies = np.array(self.latencies) * 1000
+            summary.update({
+                'mean_ms': float(latencies.mean()),
+                'p50_ms': float(np.percentile(latencies, 50)),
+                'p95_ms': float(np.percentile(latencies, 95)),
+                'max_ms': float(latencies.max()),
+            })
+
+        return summary
+
+    def report(self, file=sys.stdout):
+        """Print the counts and the latency percentiles."""
+        s = self.summary()
+        message = (
+            f'{self.name}: {s["polls"]} polls: {s["changes"]} change(s), '
+            f'{s["not_modified"]} not modified, {s["unchanged"]} unchanged, '
+            f'{s["errors"]} error(s)'
+        )
+        if 'mean_ms' in s:
+            message += (
+                f'; latency mean {s["mean_ms"]:.1f} ms, '
+                f'p50 {s["p50_ms"]:.1f} ms, p95 {s["p95_ms"]:.1f} ms, '
+                f'max {s["max_ms"]:.1f} ms'
+            )
+        print(message, file=file, flush=True)
+
+
+def get_backoff(failures, interval, max_delay):
+    """
+    Get how long to wait after a number of consecutive failures.
+
+    The delay doubles with each failure up to `max_delay` and a random delay of
+    up to that amount is chosen ("full jitter") so that retries are spread out.
+    """
+    cap = min(max_delay, interval * 2 ** failures)
+    return random.uniform(0, cap)
+
+
+def make_session(pool_size=1):
+    """Make an HTTP session that keeps up to `pool_size` connections alive."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+
+class FlagPoller:
+    """Poll the flag status API and record each change of a reach's flag."""
+
+    def __init__(
+        self, store, reach='isis', url=URL, interval=60, timeout=10,
+        max_delay=900, session=None, semaphore=None
+    ):
+        self.store = store
+        self.reach = reach
+        self.url = url.format(reach=reach)
+        self.interval = interval
+        self.timeout = timeout
+        self.max_delay = max_delay
+        # Connections are kept alive between polls
+        self.session = make_session() if session is None else session
+        # Limits the number of requests in flight (shared between pollers)
+        self.semaphore = nullcontext() if semaphore is None else semaphore
+        # Validators of the last response, for conditional requests
+        self.etag = None
+        self.last_modified = None
+        # The most recent change that has been recorded
+        self.last_set_date = store.last_set_date()
+        self.stats = PollStats(reach)
+
+    def fetch(self):
+        """
+        Get the status from the API.
+
+        Returns None if the status has not been modified since the last
+        response.
+        """
+        headers = {}
+        if self.etag is not None:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified is not None:
+            headers['If-Modified-Since'] = self.last_modified
+        response = self.session.get(
+            self.url, headers=headers, timeout=self.timeout
+        )
+        if response.status_code == 304:
+            # 304 Not Modified
+            return None
+        if response.status_code != 200:
+            raise ValueError(
+                f'Error: {response.status_code} - {response.reason}'
+            )
+        self.etag = response.headers.get('ETag')
+        self.last_modified = response.headers.get('Last-Modified')
+
+        return response.json()
+
+    def save(self, row):
+        """Add a status to the data store if it is a new change of flag."""
+        # Remove the notices
+        row.pop('notices', None)
+        if not row.get('reach'):
+            row['reach'] = self.reach
+        set_date = to_nanoseconds(row['set_date'])
+        if self.last_set_date is not None and set_date <= self.last_set_date:
+            # The flag has not changed (eg only the notices have)
+            return False
+        if not self.store.append(row):
+            # This data is not new
+            return False
+        self.last_set_date = set_date
+
+        return True
+
+    async def poll(self):
+        """Poll the API once and return the new status, if there is one."""
+        start = time.perf_counter()
+        try:
+            # The blocking request runs in a thread so that the event loop is
+            # free to poll other reaches and handle signals while waiting
+            async with self.semaphore:
+                row = await asyncio.to_thread(self.fetch)
+        finally:
+            self.stats.record(time.perf_counter() - start)
+        if row is None:
+            self.stats.not_modified += 1
+            return None
+        if not self.save(row):
+            self.stats.unchanged += 1
+            return None
+        self.stats.changes += 1
+
+        return row
+
+    async def run(self, stop=None, polls=None, report_every=None):
+        """
+        Poll until `stop` is set or `polls` polls have been made.
+
+        The statistics are reported every `report_every` polls.
+        """
+        if stop is None:
+            stop = asyncio.Event()
+        failures = 0
+        while not stop.is_set():
+            try:
+                row = await self.poll()
+            except (requests.RequestException, ValueError) as error:
+                self.stats.errors += 1
+                failures += 1
+                delay = get_backoff(failures, self.interval, self.max_delay)
+                message = f'{self.reach}: {error}'
+                if polls is None or self.stats.polls < polls:
+                    message += f'; retrying in {delay:.1f} s'
+                print(message, file=sys.stderr)
+            else:
+                failures = 0
+                delay = self.interval
+                if row is not None:
+                    print(row, flush=True)
+            if report_every and self.stats.polls % report_every == 0:
+                self.stats.report()
+            if polls is not None and self.stats.polls >= polls:
+                break
+            try:
+                # Wait for the next poll, unless told to stop
+                await asyncio.wait_for(stop.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+        return self.stats
+
+
+def make_pollers(reaches, folder='.', concurrency=4, **options):
+    """
+    Make a poller for each reach, writing to the reach's change log.
+
+    The pollers share one session and no more than `concurrency` of them make
+    a request at once. The options are those of `FlagPoller`.
+    """
+    session = make_session(pool_size=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    pollers = []
+    for reach in reaches:
+        store = FlagStore(get_reach_path(reach, folder))
+        if store.csv_path.exists() and not store.has_sidecar():
+            store.migrate()
+        pollers.append(FlagPoller(
+            store, reach, session=session, semaphore=semaphore, **options
+        ))
+
+    return pollers
+
+
+async def collect(pollers, stop=None, polls=None, report_every=None):
+    """Run the pollers of several reaches at once."""
+    try:
+        stats = await asyncio.gather(*[
+            poller.run(stop, polls, report_every) for poller in pollers
+        ])
+    finally:
+        sessions = {id(poller.session): poller.session for poller in pollers}
+        for session in sessions.values():
+            session.close()
+
+    return stats
+
+
+async def run_daemon(pollers, report_every=None):
+    """Poll until interrupted, then report the statistics of each reach."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Signal handlers are not available on this platform
+            pass
+    stats = await collect(pollers, stop, report_every=report_every)
+    for reach_stats in stats:
+        reach_stats.report()
+
+    return stats
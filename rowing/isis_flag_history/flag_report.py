@@ -0,0 +1,223 @@
+"""
+Write the table and draw the calendar of Isis flags for each term.
+
+The terms can be reported in parallel: each one is a self-contained task (its
+hourly data, its Peak Term percentages and its names) that a worker process
+turns into a `*_term.txt` table and a `*_term.png` calendar. The calendars of
+several reaches can also be drawn side by side.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+
+import matplotlib.pyplot as plt
+
+from flag_history import FLAGS
+from flag_live import update_term
+from flag_plot import RENDERERS, format_axes
+from term_calendar import get_peak_term
+from flag_text import get_label_cache
+from flag_timing import StageLog
+
+
+def get_stem(year, term_name, reach='isis'):
+    """Get the name of a term's output files, without the extension."""
+    stem = f'{year}_{term_name.lower()}_term'
+    if reach != 'isis':
+        # The Isis's files have no prefix
+        stem = f'{reach}_{stem}'
+    return stem
+
+
+def write_table(path, colour_percentage, peak_term_start, peak_term_end, now):
+    """Write the percentage of Peak Term under each flag to a file."""
+    with open(path, 'w') as file:
+        if now > peak_term_end:
+            file.write('Percentage of Peak Term* under each flag:\n')
+        else:
+            file.write('Percentage of Peak Term* - so far - under each flag:')
+            file.write('\n')
+        file.write('\n')
+        file.write('| | % |\n')
+        file.write('|---|:---:|\n')
+        for colour in FLAGS:
+            if colour in colour_percentage.index:
+                file.write(f'| {colour} | {colour_percentage[colour]} |\n')
+            else:
+                file.write(f'| {colour} | 0 |\n')
+        file.write('\n')
+        start = peak_term_start.date()
+        end = peak_term_end.date()
+        file.write(f'*{start} to {end} inclusive')
+
+
+def plot_term(
+    path, full_term, term_name, year, renderer='grid', reach='isis',
+    labels=None, log=None
+):
+    """
+    Draw the calendar of a term's flags and save it to a file.
+
+    `labels` is the cache of label outlines to draw the dates and months from
+    (default: write them as text) and `log` is the StageLog to time the
+    drawing and saving with.
+    """
+    log = log or StageLog()
+    with log.stage('draw', rows=len(full_term), renderer=renderer):
+        # Define the figure and axis
+        fig, ax = plt.subplots(figsize=(6, 4), dpi=141)
+        # Draw each hour of the term in the colour of its flag
+        RENDERERS[renderer](ax, full_term, labels)
+        # Label the days and weeks
+        format_axes(ax, full_term, term_name, year, reach)
+    with log.stage('savefig'):
+        fig.savefig(path)
+        plt.close(fig)
+
+
+def plot_comparison(
+    path, full_terms, reaches, term_name, year, renderer, labels=None,
+    log=None
+):
+    """Draw the calendars of several reaches side by side."""
+    log = log or StageLog()
+    rows = sum(len(full_term) for full_term in full_terms)
+    with log.stage('draw', rows=rows, renderer=renderer):
+        fig, axes = plt.subplots(
+            1, len(reaches), figsize=(6 * len(reaches), 4), dpi=141,
+            squeeze=False
+        )
+        for ax, full_term, reach in zip(axes[0], full_terms, reaches):
+            RENDERERS[renderer](ax, full_term, labels)
+            format_axes(ax, full_term, term_name, year, reach)
+    with log.stage('savefig'):
+        fig.savefig(path)
+        plt.close(fig)
+
+
+def get_labels(task):
+    """Get the label cache of a task, if it uses one."""
+    if task.get('label_cache') is None:
+        return None
+    return get_label_cache(task['label_cache'])
+
+
+def get_log(task):
+    """Get the StageLog of a task, with the term and reach as context."""
+    log = task.get('log') or StageLog()
+    return log.bind(
+        year=task['year'], term=task['term_name'],
+        reach=task.get('reach', '+'.join(task.get('reaches', [])))
+    )
+
+
+def report_term(task):
+    """Write the table and draw the calendar of one term of one reach."""
+    stem = get_stem(task['year'], task['term_name'], task['reach'])
+    log = get_log(task)
+    with log.stage('table'):
+        write_table(
+            f'{stem}.txt', task['colour_percentage'],
+            task['peak_term_start'], task['peak_term_end'], task['now']
+        )
+    with log.stage('labels'):
+        labels = get_labels(task)
+    if task.get('incremental'):
+        # Recolour only the hours that have changed since the last run
+        update_term(
+            f'{stem}.png', task['full_term'], task['term'], task['reach'],
+            labels, task['now'], log
+        )
+    else:
+        plot_term(
+            f'{stem}.png', task['full_term'], task['term_name'],
+            task['year'], task['renderer'], task['reach'], labels, log
+        )
+
+    return stem
+
+
+def report_comparison(task):
+    """Draw the calendars of one term of several reaches side by side."""
+    stem = get_stem(task['year'], task['term_name']) + '_reaches'
+    plot_comparison(
+        f'{stem}.png', task['full_terms'], task['reaches'],
+        task['term_name'], task['year'], task['renderer'],
+        get_labels(task), get_log(task)
+    )
+
+    return stem
+
+
+def init_worker():
+    """Render off-screen in a worker process."""
+    plt.switch_backend('Agg')
+
+
+def report_terms(tasks, jobs=None, report=report_term):
+    """
+    Report each of the terms, in parallel if `jobs` is more than one.
+
+    `jobs` is the number of worker processes (default: one per CPU, but no
+    more than there are terms). The workers are forked so that they inherit
+    the data, the text settings (eg whether to use LaTeX) and the label cache
+    without re-running the script; where that is not possible the terms are
+    reported one after another. `report` is the function that reports one
+    task. Returns the names of the files written.
+    """
+    if jobs is None:
+        jobs = min(len(tasks), os.cpu_count() or 1)
+    if jobs <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        return [report(task) for task in tasks]
+
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(
+        max_workers=jobs, mp_context=context, initializer=init_worker
+    ) as executor:
+        return list(executor.map(report, tasks))
+
+
+def write_summary(path, percentages, terms, now):
+    """Write the percentage of each Peak Term under each flag to one table."""
+    with open(path, 'w') as file:
+        file.write('Percentage of Peak Term under each flag:\n')
+        file.write('\n')
+        file.write('| | ' + ' | '.join(FLAGS) + ' |\n')
+        file.write('|---|' + ':---:|' * len(FLAGS) + '\n')
+        for term in terms:
+            year, term_name = term[:2]
+            _, peak_term_end = get_peak_term(term)
+            row = percentages.loc[(year, term_name)].dropna()
+            cells = [str(row.get(flag, 0)) for flag in FLAGS]
+            name = f'{term_name} {year}'
+            if now <= peak_term_end:
+                # The term's Peak Term is not over yet
+                name += ' (so far)'
+            file.write(f'| {name} | ' + ' | '.join(cells) + ' |\n')
+
+
+def write_comparison(path, percentages, terms, now):
+    """
+    Write the percentage of each reach's Peak Terms under each flag.
+
+    `percentages` is a dictionary of each reach's data frame of percentages.
+    """
+    with open(path, 'w') as file:
+        file.write('Percentage of Peak Term under each flag:\n')
+        file.write('\n')
+        file.write('| | | ' + ' | '.join(FLAGS) + ' |\n')
+        file.write('|---|---|' + ':---:|' * len(FLAGS) + '\n')
+        for term in terms:
+            year, term_name = term[:2]
+            _, peak_term_end = get_peak_term(term)
+            name = f'{term_name} {year}'
+            if now <= peak_term_end:
+                # The term's Peak Term is not over yet
+                name += ' (so far)'
+            for reach, reach_percentages in percentages.items():
+                row = reach_percentages.loc[(year, term_name)].dropna()
+                cells = [str(row.get(flag, 0)) for flag in FLAGS]
+                file.write(
+                    f'| {name} | {reach.title()} | ' + ' | '.join(cells) +
+                    ' |\n'
+                )
@@ -0,0 +1,121 @@
+"""
+Work out how long each flag was flying for, straight from the change points.
+
+Rather than forward-filling the history onto an hourly grid, each change of
+flag is treated as the start of an interval that lasts until the next change.
+Cumulative sums of the interval lengths (one per flag) then give the time
+under each flag up to any moment, so the time under each flag within any
+number of windows can be found with a binary search for each window's start
+and end.
+
+Times are measured either exactly (in nanoseconds) or, to match the hourly
+resampling that the figures use, by counting the whole hours (00:00, 01:00,
+...) that fall within each interval.
+"""
+import numpy as np
+import pandas as pd
+
+from term_calendar import get_peak_term
+
+# One hour in nanoseconds
+HOUR = 3600 * 10**9
+
+
+def ceil_div(a, b):
+    """Divide integers, rounding up."""
+    return -(-a // b)
+
+
+def get_change_points(df):
+    """
+    Get the times (in ns since the epoch) and flags of the changes of flag.
+
+    Returns the times, the code of each flag and the list of flags that the
+    codes refer to.
+    """
+    df = df.dropna(subset=['status_text']).sort_values('set_date')
+    times = df['set_date'].to_numpy('datetime64[ns]').view(np.int64)
+    codes, flags = pd.factorize(df['status_text'], sort=False)
+
+    return times, codes, list(flags)
+
+
+def time_under_flags(times, codes, n_flags, starts, stops, until, exact=False):
+    """
+    Get the time under each flag within each window [start, stop).
+
+    The last flag is taken to fly until `until`. All times are in ns since the
+    epoch. Returns an array with a row for each window and a column for each
+    flag, in ns if `exact` or otherwise as the number of whole hours. With no
+    changes of flag, no time is spent under any flag.
+    """
+    times = np.asarray(times, dtype=np.int64)
+    codes = np.asarray(codes)
+    starts = np.asarray(starts, dtype=np.int64)
+    stops = np.asarray(stops, dtype=np.int64)
+    result = np.zeros((len(starts), n_flags), dtype=np.int64)
+    if len(times) == 0:
+        return result
+    if exact:
+        def clock(t):
+            return t
+    else:
+        def clock(t):
+            # The number of whole hours before t (give or take a constant)
+            return ceil_div(t, HOUR)
+
+    # Each interval runs from one change to the next
+    ends = np.append(times[1:], max(until, times[-1]))
+    lengths = clock(ends) - clock(times)
+
+    def cumulative(x, flag, totals):
+        """Get the time under a flag before each moment in x."""
+        # The interval that each moment falls in
+        j = np.searchsorted(times, x, side='right') - 1
+        inside = j >= 0
+        j = np.maximum(j, 0)
+        # The whole intervals before it, plus the part of this one
+        partial = clock(np.minimum(x, ends[j])) - clock(times[j])
+        partial = np.where(codes[j] == flag, np.maximum(partial, 0), 0)
+        before = np.where(j > 0, totals[j - 1], 0)
+        return np.where(inside, before + partial, 0)
+
+    for flag in range(n_flags):
+        totals = np.cumsum(np.where(codes == flag, lengths, 0))
+        result[:, flag] = \
+            cumulative(stops, flag, totals) - cumulative(starts, flag, totals)
+
+    return result
+
+
+def get_peak_term_percentages(df, terms, now, exact=False):
+    """
+    Get the percentage of each term's Peak Term spent under each flag.
+
+    `df` is the flag history (one row per change of flag) and `terms` is a
+    list of (year, term, start of 0th Week, end of Peak Term) tuples. Hours
+    from `now` onwards are not counted. Returns a data frame with a row for
+    each term and a column for each flag, which is blank (NaN) for flags that
+    did not fly during a term's Peak Term.
+    """
+    times, codes, flags = get_change_points(df)
+    starts = []
+    stops = []
+    for term in terms:
+        peak_term_start, peak_term_end = get_peak_term(term)
+        starts.append(pd.Timestamp(peak_term_start).value)
+        # The last hour of Peak Term is included
+        stops.append(pd.Timestamp(peak_term_end).value + HOUR)
+    until = pd.Timestamp(now).value
+    durations = time_under_flags(
+        times, codes, len(flags), starts, stops, until, exact
+    )
+
+    index = pd.MultiIndex.from_tuples(
+        [(term[0], term[1]) for term in terms], names=['year', 'term']
+    )
+    durations = pd.DataFrame(durations, index=index, columns=flags)
+    totals = durations.sum(axis=1)
+    percentages = (durations.div(totals, axis=0)) * 100
+
+    return percentages.round(1).where(durations > 0)
@@ -0,0 +1,203 @@
+"""
+Append-only storage for the Isis flag history.
+
+The CSV file remains the human-readable record of every status change and is
+only ever appended to. Alongside it is a compact binary sidecar with one
+fixed-size record per change (an int64 timestamp and a small-int flag code)
+and a JSON list of the flag names that the codes refer to. The sidecar can be
+memory-mapped and searched so that only the time range of interest is loaded.
+
+Run this file with `--migrate` to build the sidecar from an existing CSV.
+"""
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import csv
+import json
+
+import numpy as np
+import pandas as pd
+
+# The reaches whose flags OURCs publishes
+REACHES = ['isis', 'godstow']
+# One record per status change
+RECORD = np.dtype([('set_date', '<i8'), ('code', 'u1')])
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def to_nanoseconds(set_date):
+    """Convert an ISO 8601 date string to nanoseconds since the epoch."""
+    dt = datetime.fromisoformat(set_date)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    delta = dt - EPOCH
+    microseconds = (delta.days * 86400 + delta.seconds) * 10**6 + \
+        delta.microseconds
+    return microseconds * 1000
+
+
+def get_reach_path(reach, folder='.'):
+    """
+    Get the path of the CSV change log of a reach.
+
+    The Isis's log is `master.csv` and every other reach's is named after it.
+    """
+    if reach == 'isis':
+        return Path(folder, 'master.csv')
+    return Path(folder, f'{reach}.csv')
+
+
+class FlagStore:
+    """A flag history CSV file and its binary sidecar."""
+
+    def __init__(self, path='master.csv'):
+        self.csv_path = Path(path)
+        self.bin_path = self.csv_path.with_suffix('.bin')
+        self.flags_path = self.csv_path.with_suffix('.flags.json')
+
+    def has_sidecar(self):
+        """Check that the sidecar exists and is not older than the CSV."""
+        if not (self.bin_path.exists() and self.flags_path.exists()):
+            return False
+        if not self.csv_path.exists():
+            return True
+        # Appends write the CSV first, so an older sidecar is out of date
+        return self.bin_path.stat().st_mtime_ns >= \
+            self.csv_path.stat().st_mtime_ns
+
+    def flags(self):
+        """Get the flag names in the order of their codes."""
+        if not self.flags_path.exists():
+            return []
+        with open(self.flags_path) as file:
+            return json.load(file)
+
+    def __len__(self):
+        if not self.bin_path.exists():
+            return 0
+        return self.bin_path.stat().st_size // RECORD.itemsize
+
+    def last_set_date(self):
+        """Get the time (in ns) of the latest change without a full read."""
+        if len(self) == 0:
+            return None
+        with open(self.bin_path, 'rb') as file:
+            file.seek(-RECORD.itemsize, 2)
+            record = np.frombuffer(file.read(RECORD.itemsize), dtype=RECORD)
+        return int(record['set_date'][0])
+
+    def _encode(self, status_text, flags):
+        """Get the code of a flag, adding it to the list if it is new."""
+        if status_text not in flags:
+            flags.append(status_text)
+            with open(self.flags_path, 'w') as file:
+                json.dump(flags, file)
+        return flags.index(status_text)
+
+    def append(self, record):
+        """
+        Append a status change to the CSV file and the sidecar.
+
+        Returns False (and writes nothing) if the change has already been
+        recorded. If the CSV file has no sidecar, or it is out of date, the
+        sidecar is built from the CSV file first.
+        """
+        csv_exists = self.csv_path.exists() and \
+            self.csv_path.stat().st_size > 0
+        if csv_exists and not self.has_sidecar():
+            # Otherwise the history would look empty and every change new
+            self.migrate()
+        set_date = to_nanoseconds(record['set_date'])
+        last = self.last_set_date()
+        if last is not None and set_date <= last:
+            # This data is not new
+            return False
+
+        # Append a row to the CSV file, using its existing column order
+        if csv_exists:
+            with open(self.csv_path, newline='') as file:
+                fieldnames = next(csv.reader(file))
+            header = False
+        else:
+            fieldnames = list(record)
+            header = True
+        with open(self.csv_path, 'a', newline='') as file:
+            writer = csv.DictWriter(
+                file, fieldnames=fieldnames, extrasaction='ignore'
+            )
+            if header:
+                writer.writeheader()
+            writer.writerow(record)
+
+        # Append a record to the sidecar
+        code = self._encode(record['status_text'], self.flags())
+        row = np.array([(set_date, code)], dtype=RECORD)
+        with open(self.bin_path, 'ab') as file:
+            row.tofile(file)
+
+        return True
+
+    def load(self, start=None, end=None):
+        """
+        Load the status changes between two times.
+
+        The change immediately before `start` is included so that the flag
+        flying at `start` is known.
+        """
+        flags = self.flags()
+        if len(self) == 0:
+            records = np.zeros(0, dtype=RECORD)
+        else:
+            records = np.memmap(self.bin_path, dtype=RECORD, mode='r')
+        set_dates = records['set_date']
+        # Find the range of interest with a binary search
+        i = 0
+        j = len(records)
+        if start is not None:
+            start = pd.Timestamp(start).value
+            i = max(np.searchsorted(set_dates, start, side='right') - 1, 0)
+        if end is not None:
+            end = pd.Timestamp(end).value
+            j = np.searchsorted(set_dates, end, side='right')
+        records = np.array(records[i:j])
+
+        return pd.DataFrame({
+            'status_text': pd.Categorical.from_codes(
+                records['code'], categories=flags
+            ),
+            'set_date': pd.to_datetime(records['set_date'], utc=True),
+        })
+
+    def migrate(self):
+        """Build the sidecar from scratch from the CSV file."""
+        df = pd.read_csv(self.csv_path)
+        # Parse all of the dates at once
+        set_dates = pd.DatetimeIndex(
+            pd.to_datetime(df['set_date'], format='ISO8601', utc=True)
+        )
+        set_dates = set_dates.as_unit('ns').asi8
+        codes, flags = pd.factorize(df['status_text'])
+        records = np.empty(len(df), dtype=RECORD)
+        records['set_date'] = set_dates
+        records['code'] = codes
+        with open(self.flags_path, 'w') as file:
+            json.dump(list(flags), file)
+        records.tofile(self.bin_path)
+
+        return len(records)
+
+
+if __name__ == '__main__':
+    # Create command-line argument parser
+    parser = argparse.ArgumentParser()
+    # Add optional arguments
+    parser.add_argument('--path', '-p', default='master.csv')
+    parser.add_argument('--migrate', '-m', action='store_true')
+    # Parse arguments from terminal
+    args = parser.parse_args()
+
+    store = FlagStore(args.path)
+    if args.migrate:
+        n = store.migrate()
+        print(f'Wrote {n} records to {store.bin_path}')
+    print(f'{len(store)} status changes; flags: {", ".join(store.flags())}')
@@ -0,0 +1,165 @@
+"""
+Set up the text of the Isis flag calendars and cache the shapes of the labels.
+
+The calendars can have their text typeset by LaTeX ("tex") or by Matplotlib's
+own mathtext engine with the Computer Modern font ("mathtext"), which looks
+much the same but needs neither a TeX installation nor a LaTeX run for every
+label.
+
+Either way, the labels that are written in the hours' blocks (the day numbers
+and month names, which make up most of the text of a calendar) are drawn from
+a cache of their outlines. Each label is typeset once, by whichever engine is
+in use, and its outline is saved to a file so that later terms and later runs
+can draw it as a shape without typesetting it again.
+"""
+from pathlib import Path
+import hashlib
+import os
+
+import numpy as np
+import matplotlib
+from matplotlib.font_manager import FontProperties
+from matplotlib.collections import PathCollection
+from matplotlib.path import Path as MplPath
+from matplotlib.textpath import TextPath
+import matplotlib.transforms as mtransforms
+
+# The ways of typesetting the text
+TEXT_MODES = ['tex', 'mathtext']
+# The file of cached label outlines
+LABEL_CACHE = '.flag_labels.npz'
+# The settings that change the shapes of the labels
+RC_KEYS = [
+    'text.usetex', 'text.latex.preamble', 'font.family', 'font.serif',
+    'mathtext.fontset',
+]
+
+
+def use_text(mode):
+    """Set Matplotlib up to typeset the text in one of the TEXT_MODES."""
+    if mode == 'tex':
+        # Use LaTeX for graphs' text
+        matplotlib.rc('text', usetex=True)
+        # Use the serif font
+        matplotlib.rc('font', family='serif')
+        # Be able to use Greek symbols in text mode
+        matplotlib.rc('text.latex', preamble=r'\usepackage{textgreek}')
+    elif mode == 'mathtext':
+        # Use Matplotlib's own typesetting with the Computer Modern font
+        matplotlib.rc('text', usetex=False)
+        matplotlib.rc('font', family='serif', serif=['cmr10'])
+        matplotlib.rc('mathtext', fontset='cm')
+        matplotlib.rc('axes.formatter', use_mathtext=True)
+    else:
+        raise ValueError(f'Unknown text mode: {mode}')
+
+
+def get_fingerprint():
+    """Get a short hash of the settings that change the shapes of labels."""
+    settings = repr([matplotlib.rcParams[key] for key in RC_KEYS])
+    return hashlib.sha256(settings.encode()).hexdigest()[:12]
+
+
+class LabelCache:
+    """
+    Outlines of typeset labels, kept in memory and in a file.
+
+    The extents of each outline are kept with it, as working them out exactly
+    takes longer than drawing it.
+    """
+
+    def __init__(self, path=LABEL_CACHE):
+        self.path = None if path is None else Path(path)
+        self.outlines = {}
+        self.extents = {}
+        self.changed = False
+        if self.path is not None and self.path.exists():
+            self.load()
+
+    def load(self):
+        """Read the outlines from the file."""
+        with np.load(self.path) as data:
+            keys = data['keys']
+            for i, key in enumerate(keys):
+                key = str(key)
+                self.outlines[key] = MplPath(
+                    data[f'vertices_{i}'], data[f'codes_{i}']
+                )
+                self.extents[key] = data[f'extents_{i}']
+
+    def save(self):
+        """Write the outlines to the file if any have been added."""
+        if self.path is None or not self.changed:
+            return
+        arrays = {'keys': np.array(list(self.outlines))}
+        for i, (key, outline) in enumerate(self.outlines.items()):
+            arrays[f'vertices_{i}'] = outline.vertices
+            arrays[f'codes_{i}'] = outline.codes
+            arrays[f'extents_{i}'] = self.extents[key]
+        # Write to a temporary file first so that the cache is never left
+        # half-written
+        temporary = self.path.with_name(self.path.name + '.tmp.npz')
+        np.savez(temporary, **arrays)
+        os.replace(temporary, self.path)
+        self.changed = False
+
+    def get(self, text, size):
+        """
+        Get a label's outline (in points) and its extents (x0, y0, x1, y1),
+        typesetting it if need be.
+        """
+        key = f'{get_fingerprint()}|{size}|{text}'
+        if key not in self.outlines:
+            prop = FontProperties(size=size)
+            usetex = matplotlib.rcParams['text.usetex']
+            outline = TextPath((0, 0), text, prop=prop, usetex=usetex)
+            # Keep the vertices and codes only
+            self.outlines[key] = MplPath(outline.vertices, outline.codes)
+            self.extents[key] = np.array(outline.get_extents().extents)
+            self.changed = True
+        return self.outlines[key], self.extents[key]
+
+    def warm(self, texts, size):
+        """Typeset any of the labels that are not already cached."""
+        for text in texts:
+            self.get(text, size)
+
+    def align(self, text, size, ha='left', va='baseline'):
+        """Get a label's outline, moved so that its anchor is at (0, 0)."""
+        outline, (x0, y0, x1, y1) = self.get(text, size)
+        # Like text, left-aligned labels start at their origin
+        dx = {'left': 0, 'center': -(x0 + x1) / 2, 'right': -x1}[ha]
+        dy = {
+            'baseline': 0, 'bottom': -y0, 'center': -(y0 + y1) / 2, 'top': -y1,
+        }[va]
+        return MplPath(outline.vertices + (dx, dy), outline.codes)
+
+    def draw(self, ax, x, y, texts, size, color, ha='left', va='baseline'):
+        """
+        Draw labels at points in data coordinates.
+
+        `x`, `y` and `texts` are sequences of the same length. All of the
+        labels are drawn as one collection, which is much faster than drawing
+        each label on its own.
+        """
+        paths = [self.align(text, size, ha, va) for text in texts]
+        collection = PathCollection(
+            paths, offsets=np.column_stack([x, y]),
+            offset_transform=ax.transData, facecolors=color, linewidths=0,
+            clip_on=False, zorder=3
+        )
+        # Scale the outlines from points to pixels
+        scale = ax.figure.dpi / 72
+        collection.set_transform(mtransforms.Affine2D().scale(scale))
+        ax.add_collection(collection, autolim=False)
+
+
+# The cache of each process, loaded when first needed
+_caches = {}
+
+
+def get_label_cache(path=LABEL_CACHE):
+    """Get the label cache of this process for a file."""
+    if path not in _caches:
+        _caches[path] = LabelCache(path)
+    return _caches[path]
@@ -0,0 +1,206 @@
+"""
+Export the flag history as a compact timeline for interactive charts.
+
+The history is written as runs of one flag (run-length encoding) to a small
+JSON file, which a web page can load to draw any term without the calendars
+having to be drawn and published as images. The file looks like:
+
+    {
+        "version": 1,
+        "reach": "isis",
+        "flags": ["Black", "Red", ...],
+        "colours": ["#212121", "#E74C3C", ...],
+        "terms": [["2023", "Hilary", "2023-01-08T00:00:00Z",
+                   "2023-02-25T23:00:00Z"], ...],
+        "start": 1545656640,
+        "runs": [5, 0, ...],
+        "lengths": [86400, 3600, ...],
+        "until": 1740787200
+    }
+
+where `start` is the start of the first run (in seconds since 1970-01-01
+UTC), `runs` is the flag of each run (an index into `flags`) and `lengths` is
+the length of every run but the last (in seconds), which lasts at least until
+`until`. Runs of flags that are not in `flags` are left out.
+
+Exports are incremental: only the part of the history since the start of the
+last run is loaded, and the new runs are appended. The runs can also be
+written to an Arrow/Feather file (if pyarrow is installed) with a row for
+each run.
+
+Run this file to export the history of a reach, eg:
+
+    python flag_timeline.py --feather
+"""
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import importlib.util
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from flag_history import COLOURS, FIRST_YEAR, FLAGS, load_flag_history
+from flag_markov import get_stays
+from flag_store import REACHES, get_reach_path
+from term_calendar import get_terms
+
+# Change this when the format of the file changes
+TIMELINE_VERSION = 1
+SECOND = 10**9
+
+
+def new_timeline(reach, now):
+    """Make an empty timeline."""
+    return {
+        'version': TIMELINE_VERSION,
+        'reach': reach,
+        'flags': FLAGS,
+        'colours': [COLOURS[flag] for flag in FLAGS],
+        'terms': [list(term) for term in get_terms(FIRST_YEAR, until=now)],
+        'start': None,
+        'runs': [],
+        'lengths': [],
+        'until': None,
+    }
+
+
+def load_timeline(path, reach):
+    """Load a timeline, or None if it is missing or out of date."""
+    if not Path(path).exists():
+        return None
+    with open(path) as file:
+        timeline = json.load(file)
+    if (
+        timeline.get('version') != TIMELINE_VERSION or
+        timeline.get('reach') != reach or timeline.get('flags') != FLAGS
+    ):
+        return None
+    return timeline
+
+
+def get_last_start(timeline):
+    """Get the start of the last run of a timeline (in seconds)."""
+    if timeline['start'] is None:
+        return None
+    return timeline['start'] + sum(timeline['lengths'])
+
+
+def update_timeline(timeline, history, now):
+    """
+    Append the runs of the history that start after the timeline's last run.
+
+    Returns the number of runs appended.
+    """
+    codes, times, _ = get_stays(history)
+    seconds = times // SECOND
+    last_start = get_last_start(timeline)
+    if last_start is not None:
+        new = seconds > last_start
+        codes, seconds = codes[new], seconds[new]
+        if len(codes) and codes[0] == timeline['runs'][-1]:
+            # The last run has not ended after all
+            codes, seconds = codes[1:], seconds[1:]
+    if len(codes):
+        if last_start is None:
+            timeline['start'] = int(seconds[0])
+        else:
+            timeline['lengths'].append(int(seconds[0] - last_start))
+        timeline['lengths'].extend(np.diff(seconds).tolist())
+        timeline['runs'].extend(codes.tolist())
+    timeline['until'] = int(pd.Timestamp(now).value // SECOND)
+    timeline['terms'] = [
+        list(term) for term in get_terms(FIRST_YEAR, until=now)
+    ]
+
+    return len(codes)
+
+
+def save_timeline(path, timeline):
+    """Write a timeline to a JSON file, as compactly as possible."""
+    # Write to a temporary file first so that the timeline is never left
+    # half-written
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(timeline, file, separators=(',', ':'))
+    os.replace(temporary, path)
+
+
+def get_runs(timeline):
+    """Get a data frame with a row (start, end and flag) for each run."""
+    lengths = np.array(timeline['lengths'], dtype=np.int64)
+    starts = timeline['start'] + np.append(0, np.cumsum(lengths))
+    ends = np.append(starts[1:], max(timeline['until'], starts[-1]))
+    return pd.DataFrame({
+        'start': pd.to_datetime(starts, unit='s', utc=True),
+        'end': pd.to_datetime(ends, unit='s', utc=True),
+        'flag': pd.Categorical.from_codes(timeline['runs'], categories=FLAGS),
+    })
+
+
+def save_feather(path, timeline):
+    """Write the runs of a timeline to an Arrow/Feather file."""
+    # pandas writes Feather files with pyarrow
+    get_runs(timeline).to_feather(path)
+
+
+def export_timeline(history_path, path, reach='isis', now=None, full=False):
+    """
+    Bring the timeline of a reach up to date.
+
+    Returns the timeline and the number of runs appended to it.
+    """
+    now = now or datetime.now(timezone.utc)
+    timeline = None if full else load_timeline(path, reach)
+    if timeline is None:
+        timeline = new_timeline(reach, now)
+    last_start = get_last_start(timeline)
+    if last_start is not None:
+        # Only load the history from the start of the last run
+        last_start = pd.Timestamp(last_start, unit='s', tz='UTC')
+    history = load_flag_history(history_path, start=last_start)
+    history = history[history['set_date'] <= now]
+    appended = update_timeline(timeline, history, now)
+    save_timeline(path, timeline)
+
+    return timeline, appended
+
+
+if __name__ == '__main__':
+    # Create command-line argument parser
+    parser = argparse.ArgumentParser()
+    # Add optional arguments
+    parser.add_argument('--reach', '-R', choices=REACHES, default='isis')
+    parser.add_argument('--folder', '-f', default='.')
+    parser.add_argument(
+        '--path', '-p', default=None,
+        help='change log to export instead of that of the reach'
+    )
+    parser.add_argument(
+        '--output', '-o', default=None,
+        help='JSON file to write (default: <reach>_timeline.json)'
+    )
+    parser.add_argument(
+        '--feather', action='store_true',
+        help='also write the runs to an Arrow/Feather file (needs pyarrow)'
+    )
+    parser.add_argument(
+        '--full', action='store_true',
+        help='export the whole history again instead of appending to it'
+    )
+    # Parse arguments from terminal
+    args = parser.parse_args()
+    if args.feather and importlib.util.find_spec('pyarrow') is None:
+        parser.error('pyarrow is needed to write Arrow/Feather files')
+
+    output = args.output or f'{args.reach}_timeline.json'
+    timeline, appended = export_timeline(
+        args.path or get_reach_path(args.reach, args.folder), output,
+        args.reach, full=args.full
+    )
+    total = len(timeline['runs'])
+    print(f'Appended {appended} runs to {output} ({total} in all)')
+    if args.feather:
+        save_feather(Path(output).with_suffix('.feather'), timeline)
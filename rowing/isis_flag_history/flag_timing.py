@@ -0,0 +1,121 @@
+"""
+Time and profile the stages of an Isis flag analysis.
+
+Each stage (eg loading the history, resampling it, or drawing a term) can be
+timed and written as a line of JSON to a file, along with the term and reach
+that it was for and the number of rows that it handled, eg:
+
+    {"run": "2025-02-01T03:00:00+00:00", "stage": "resample", "reach": "isis",
+     "seconds": 0.081, "rows": 52441, ...}
+
+When no file is given nothing is timed, so the stages cost no more than an
+empty `with` block. A whole run can also be profiled with cProfile and
+tracemalloc, in which case the peak memory of each stage is recorded too.
+"""
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from pathlib import Path
+import cProfile
+import json
+import os
+import pstats
+import time
+import tracemalloc
+
+# The number of lines in each profiling report
+REPORT_LINES = 30
+
+
+class StageLog:
+    """
+    Time stages and append them to a file of JSON lines.
+
+    `context` is included in every line (eg the run and the reach). If `path`
+    is None then nothing is timed or written.
+    """
+
+    def __init__(self, path=None, **context):
+        self.path = path
+        self.context = context
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def bind(self, **context):
+        """Get a log of the same file with more context."""
+        return StageLog(self.path, **{**self.context, **context})
+
+    def stage(self, name, **fields):
+        """
+        Time a stage as a context manager.
+
+        The dictionary that it gives can have more fields (eg the number of
+        rows) added to it before the stage ends.
+        """
+        if self.path is None:
+            return nullcontext({})
+        return self._time(name, fields)
+
+    @contextmanager
+    def _time(self, name, fields):
+        record = {**self.context, 'stage': name, **fields}
+        memory = tracemalloc.is_tracing()
+        if memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = round(time.perf_counter() - start, 6)
+            if memory:
+                record['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            record['pid'] = os.getpid()
+            self.write(record)
+
+    def write(self, record):
+        """Append a record to the file as one line."""
+        line = json.dumps(record, default=str) + '\n'
+        # One write per line so that worker processes do not interleave
+        with open(self.path, 'a') as file:
+            file.write(line)
+
+
+def get_run_id():
+    """Get an identifier of this run: the time that it started."""
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+@contextmanager
+def profiled(folder, name='analyse'):
+    """
+    Profile the code in a `with` block with cProfile and tracemalloc.
+
+    Writes `<name>.prof` (for pstats or snakeviz), `<name>.txt` (the slowest
+    functions) and `<name>_memory.txt` (the lines that allocated the most
+    memory) to `folder`. Does nothing if `folder` is None.
+    """
+    if folder is None:
+        yield
+        return
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    tracemalloc.start()
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        profile.dump_stats(folder / f'{name}.prof')
+        with open(folder / f'{name}.txt', 'w') as file:
+            stats = pstats.Stats(profile, stream=file)
+            stats.sort_stats('cumulative').print_stats(REPORT_LINES)
+        with open(folder / f'{name}_memory.txt', 'w') as file:
+            file.write(f'Peak traced memory: {peak / 2**20:.1f} MB\n\n')
+            for stat in snapshot.statistics('lineno')[:REPORT_LINES]:
+                file.write(f'{stat}\n')
@@ -0,0 +1,142 @@
+"""Forecast the Isis flag over the rest of the term."""
+import matplotlib.pyplot as plt
+from datetime import datetime, timedelta, timezone
+import platform
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from flag_history import COLOURS, FLAGS, load_flag_history
+from flag_markov import FlagModel, forecast, get_current_stay
+from flag_report import get_stem
+from flag_stats import HOUR, ceil_div, get_change_points, time_under_flags
+from flag_store import REACHES, get_reach_path
+from flag_text import TEXT_MODES, use_text
+from term_calendar import get_boundaries, get_peak_term, get_terms
+
+if platform.system() == 'Linux':
+    # Set the Matplotlib backend to one that is compatible with Wayland
+    plt.switch_backend('Agg')
+
+# Create command-line argument parser
+parser = argparse.ArgumentParser()
+# Add optional arguments
+parser.add_argument('--reach', '-R', choices=REACHES, default='isis')
+parser.add_argument('--folder', '-f', default='.')
+parser.add_argument(
+    '--path', '-p', default=None,
+    help='change log to analyse instead of that of the reach'
+)
+parser.add_argument(
+    '--trajectories', '-n', type=int, default=20000,
+    help='number of futures to simulate (default: 20000)'
+)
+parser.add_argument('--seed', '-s', type=int, default=None)
+parser.add_argument(
+    '--jobs', '-j', type=int, default=1,
+    help='number of processes to simulate the futures with (default: 1)'
+)
+parser.add_argument(
+    '--now', default=None,
+    help='forecast from this time instead of now (eg 2025-01-25T12:00Z, in '
+    'UTC unless it says otherwise), ignoring the history after it'
+)
+parser.add_argument('--text', choices=TEXT_MODES, default='tex')
+# Parse arguments from terminal
+args = parser.parse_args()
+
+now = datetime.now(timezone.utc)
+if args.now is not None:
+    now = pd.Timestamp(args.now)
+    # A time without a time zone is taken to be in UTC
+    if now.tz is None:
+        now = now.tz_localize('UTC')
+    else:
+        now = now.tz_convert('UTC')
+    now = now.to_pydatetime()
+
+# The term that is going on now or, in the vacation, the next one
+terms = get_terms(now.year - 1, now.year + 1)
+_, ninth_ends = get_boundaries(terms)
+i = np.searchsorted(ninth_ends, pd.Timestamp(now).value)
+year, term_name = terms[i][:2]
+peak_term_start, peak_term_end = get_peak_term(terms[i])
+
+# Estimate the model from the whole history up to now
+history = load_flag_history(
+    args.path or get_reach_path(args.reach, args.folder)
+)
+history = history[history['set_date'] <= now]
+model = FlagModel.estimate(history)
+flag, age = get_current_stay(history, now)
+
+# Simulate the hours from now to the end of 9th Week
+start = ceil_div(pd.Timestamp(now).value, HOUR) * HOUR
+hours = int((ninth_ends[i] - start) // HOUR) + 1
+began = time.perf_counter()
+probabilities = forecast(
+    model, flag, age, start, hours, args.trajectories, args.seed, args.jobs
+)
+seconds = time.perf_counter() - began
+datetimes = pd.date_range(
+    pd.Timestamp(start, tz='UTC'), periods=hours, freq='h'
+)
+print(
+    f'Simulated {args.trajectories} futures of {hours} hours in '
+    f'{seconds:.2f}s, starting from {FLAGS[flag]} (for {age:.0f} hours)'
+)
+
+# The expected hours of Peak Term under each flag: those that have flown so
+# far plus those that are forecast
+times, codes, flags = get_change_points(history)
+so_far = time_under_flags(
+    times, codes, len(flags), [pd.Timestamp(peak_term_start).value],
+    [pd.Timestamp(peak_term_end).value + HOUR], pd.Timestamp(now).value
+)[0]
+so_far = pd.Series(so_far, index=flags).reindex(FLAGS, fill_value=0)
+in_peak_term = (datetimes >= peak_term_start) & (datetimes <= peak_term_end)
+to_come = probabilities[in_peak_term].sum(axis=0)
+expected = so_far.to_numpy() + to_come
+expected = 100 * expected / expected.sum()
+
+stem = get_stem(year, term_name, args.reach) + '_forecast'
+with open(f'{stem}.txt', 'w') as file:
+    file.write('Expected percentage of Peak Term* under each flag:\n')
+    file.write('\n')
+    file.write('| | % |\n')
+    file.write('|---|:---:|\n')
+    for colour, percentage in zip(FLAGS, expected):
+        file.write(f'| {colour} | {percentage:.1f} |\n')
+    file.write('\n')
+    start_date = peak_term_start.date()
+    end_date = peak_term_end.date()
+    file.write(f'*{start_date} to {end_date} inclusive, as of {now:%Y-%m-%d}')
+pd.DataFrame(probabilities, index=datetimes, columns=FLAGS).round(4).to_csv(
+    f'{stem}.csv', index_label='datetime'
+)
+
+# Plot the chance of each flag over time
+use_text(args.text)
+fig, ax = plt.subplots(figsize=(6, 4), dpi=141)
+ax.stackplot(
+    datetimes, probabilities.T, colors=[COLOURS[f] for f in FLAGS],
+    labels=FLAGS
+)
+ax.axvspan(
+    peak_term_start, peak_term_end + timedelta(hours=1), color='k',
+    alpha=0.08, lw=0
+)
+ax.set_xlim(datetimes[0], datetimes[-1])
+ax.set_ylim(0, 1)
+ax.set_ylabel('Probability')
+ax.tick_params(axis='x', labelsize=8)
+ax.legend(fontsize=6, loc='lower left', ncol=4)
+ax.set_title(
+    f'OURCs {args.reach.title()} Flag Forecast\n{term_name} Term {year}',
+    fontsize=12
+)
+fig.autofmt_xdate()
+fig.savefig(f'{stem}.png')
+plt.close(fig)
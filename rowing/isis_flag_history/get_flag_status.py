@@ -1,45 +1,55 @@
-"""Get the Isis flag status."""
-import requests
-from pathlib import Path
-import pandas as pd
+"""Get the flag status of the Isis and the other OURCs reaches."""
+import asyncio
+import argparse
 
-# Import the master data frame, or initialise it if it does not exist
-path = Path('master.csv')
-if path.exists():
-    df = pd.read_csv(path)
-else:
-    df = pd.DataFrame()
+from flag_poller import URL, make_pollers, collect, run_daemon
+from flag_store import REACHES
+
+# Create command-line argument parser
+parser = argparse.ArgumentParser()
+# Add optional arguments
+parser.add_argument(
+    '--reaches', '-r', nargs='+', default=['isis'],
+    help=f'reaches to get the status of (eg {" ".join(REACHES)})'
+)
+parser.add_argument(
+    '--folder', '-f', default='.',
+    help='folder of the change logs (master.csv for the Isis, <reach>.csv)'
+)
+parser.add_argument('--url', '-u', default=URL)
+parser.add_argument(
+    '--concurrency', '-c', type=int, default=4,
+    help='most reaches to request at once (default: 4)'
+)
+parser.add_argument(
+    '--daemon', '-d', action='store_true',
+    help='keep polling the API instead of checking it once'
+)
+parser.add_argument(
+    '--interval', '-i', type=float, default=60,
+    help='seconds between polls in daemon mode (default: 60)'
+)
+parser.add_argument(
+    '--report_every', type=int, default=60,
+    help='polls between reports of the latency in daemon mode (default: 60)'
+)
+# Parse arguments from terminal
+args = parser.parse_args()
 
-# Make the API call
-response = requests.get('https://ourcs.co.uk/api/flags/status/isis/')
+# Open the data store of each reach, building its sidecar from the CSV file if
+# need be
 # Isis Flag Page
 # https://ourcs.co.uk/information/flags/isis/
+pollers = make_pollers(
+    args.reaches, args.folder, args.concurrency, url=args.url,
+    interval=args.interval
+)
 
-# Check the status code
-# https://en.wikipedia.org/wiki/List_of_HTTP_status_codes
-if response.status_code == 200:
-    # 200 OK
-    pass
+if args.daemon:
+    # Poll until interrupted
+    asyncio.run(run_daemon(pollers, args.report_every))
 else:
-    # If the request was unsuccessful, print an error message
-    raise ValueError(f'Error: {response.status_code} - {response.reason}')
-
-# Check if the status has changed since the last check
-this_call_date = response.json()['set_date']
-if len(df) == 0:
-    # The master data frame has just been initialised
-    pass
-else:
-    # A previous entry exists
-    most_recent_date = df.loc[len(df) - 1, 'set_date']
-    if this_call_date == most_recent_date:
-        # This data is not new
-        raise SystemExit
-
-# Add the received data as a row in the data frame if it is new
-row = pd.DataFrame([response.json()])
-# Remove the notices
-row = row.drop('notices', axis=1)
-df = pd.concat([df, row], ignore_index=True)
-print(df)
-df.to_csv('master.csv', index=False)
+    # Check each reach once, printing any new status
+    stats = asyncio.run(collect(pollers, polls=1))
+    if any(reach_stats.errors for reach_stats in stats):
+        raise SystemExit(1)
@@ -0,0 +1,96 @@
+"""
+Serve a stand-in for the flag status API on the local machine.
+
+The status is read from a JSON file each time it is requested, so editing the
+file simulates a change of flag. If given a folder rather than a file, the
+status of each reach is read from `<reach>.json` in it, with the reach taken
+from the end of the URL (eg `/api/flags/status/godstow/`).
+
+Responses carry an ETag (a hash of the status) and a Last-Modified time (that
+of the file) and conditional requests get "304 Not Modified" when nothing has
+changed. A proportion of requests can be made to fail so that the poller's
+retries can be tried out, eg:
+
+    python stand_in_server.py --status status.json --fail_rate 0.2 &
+    python get_flag_status.py --daemon --url http://localhost:8000/ -i 1
+
+    python stand_in_server.py --status statuses/ &
+    python get_flag_status.py -r isis godstow \
+        --url 'http://localhost:8000/api/flags/status/{reach}/'
+"""
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import argparse
+import hashlib
+import random
+
+
+def make_handler(status_path, fail_rate=0.0):
+    """Make a request handler that serves the status in a file (or folder)."""
+    status_path = Path(status_path)
+
+    class Handler(BaseHTTPRequestHandler):
+        # Keep connections alive between requests
+        protocol_version = 'HTTP/1.1'
+
+        def send_empty(self, code):
+            self.send_response(code)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def do_GET(self):
+            if random.random() < fail_rate:
+                self.send_empty(503)
+                return
+            path = status_path
+            if path.is_dir():
+                # The reach is the last part of the URL
+                reach = self.path.rstrip('/').rsplit('/', 1)[-1]
+                path = Path(status_path, f'{reach}.json')
+            if not path.is_file():
+                self.send_empty(404)
+                return
+            body = path.read_bytes()
+            etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+            last_modified = formatdate(path.stat().st_mtime, usegmt=True)
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Do not log every request
+            pass
+
+    return Handler
+
+
+def make_server(status_path, port=8000, fail_rate=0.0):
+    """Make a server (on localhost) for the status in a file."""
+    handler = make_handler(status_path, fail_rate)
+    return ThreadingHTTPServer(('localhost', port), handler)
+
+
+if __name__ == '__main__':
+    # Create command-line argument parser
+    parser = argparse.ArgumentParser()
+    # Add optional arguments
+    parser.add_argument('--status', '-s', default='status.json')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--fail_rate', type=float, default=0.0)
+    # Parse arguments from terminal
+    args = parser.parse_args()
+
+    server = make_server(args.status, args.port, args.fail_rate)
+    print(f'Serving {args.status} on http://localhost:{args.port}/')
+    server.serve_forever()
@@ -0,0 +1,86 @@
+"""
+Generate synthetic Isis flag histories for benchmarking.
+
+A history is a series of changes of flag at random (exponentially distributed)
+intervals between two dates, each to a different flag from the one before.
+The same seed always gives the same history, so that benchmarks of different
+versions of the code can be compared. Histories can be written as a CSV file
+in the same format as `master.csv`, along with its binary sidecar.
+
+Run this file to write a history, eg:
+
+    python synthetic_history.py -n 1000000 -o synthetic.csv
+"""
+from pathlib import Path
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from flag_history import FLAGS
+from flag_store import FlagStore
+
+# The span of the real history
+START = '2018-12-24T13:04:00Z'
+END = '2025-03-01T00:00:00Z'
+
+
+def generate_history(n, start=START, end=END, seed=0, reach='isis'):
+    """
+    Generate a history of `n` changes of flag between two dates.
+
+    Returns a data frame with the same columns as `master.csv`, with the dates
+    as datetimes.
+    """
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp(start).value
+    end = pd.Timestamp(end).value
+    # Whole seconds between changes, at least one, scaled to fit the span
+    intervals = rng.exponential(size=n)
+    intervals *= (end - start) / 10**9 / intervals.sum()
+    intervals = np.maximum(intervals.astype(np.int64), 1)
+    intervals[0] = 0
+    set_dates = start + np.cumsum(intervals) * 10**9
+    # Each flag differs from the one before
+    steps = rng.integers(1, len(FLAGS), size=n)
+    steps[0] = 0
+    codes = np.cumsum(steps) % len(FLAGS)
+
+    return pd.DataFrame({
+        'reach': reach,
+        'status': '',
+        'status_text': pd.Categorical.from_codes(codes, categories=FLAGS),
+        'set_date': pd.to_datetime(set_dates, utc=True),
+        'set_by': 'synthetic',
+    })
+
+
+def write_history(df, path, sidecar=True):
+    """Write a history as a CSV file (and its binary sidecar)."""
+    df = df.copy()
+    set_dates = df['set_date'].to_numpy('datetime64[s]')
+    df['set_date'] = np.char.add(
+        np.datetime_as_string(set_dates, unit='s'), 'Z'
+    )
+    df.to_csv(path, index=False)
+    if sidecar:
+        FlagStore(path).migrate()
+
+    return Path(path)
+
+
+if __name__ == '__main__':
+    # Create command-line argument parser
+    parser = argparse.ArgumentParser()
+    # Add optional arguments
+    parser.add_argument('--changes', '-n', type=int, default=10000)
+    parser.add_argument('--output', '-o', default='synthetic.csv')
+    parser.add_argument('--seed', '-s', type=int, default=0)
+    parser.add_argument('--start', default=START)
+    parser.add_argument('--end', default=END)
+    # Parse arguments from terminal
+    args = parser.parse_args()
+
+    df = generate_history(args.changes, args.start, args.end, args.seed)
+    path = write_history(df, args.output)
+    print(f'Wrote {len(df)} changes of flag to {path}')
@@ -0,0 +1,182 @@
+"""
+Work out the dates of the University of Oxford's terms.
+
+Each term's Full Term is eight weeks long, starting on a Sunday:
+
+- Hilary: the Sunday on or after 13 January
+- Trinity: the Sunday on or after 20 April, or a week later if that is Easter
+  Sunday
+- Michaelmas: the Sunday on or after 7 October
+
+A term's "0th Week" is the week before Full Term and its "Peak Term" runs from
+the Thursday of 0th Week to the Saturday of the week of the term's main races
+(Torpids in Hilary, Summer Eights in Trinity and Christ Church Regatta in
+Michaelmas). Terms that differ from these rules are listed in `OVERRIDES`.
+
+Terms are described in the same way as the rest of the Isis flag code: as
+(year, term, start of 0th Week, end of Peak Term) tuples of strings.
+"""
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# The first day of 1st Week is the first Sunday on or after this date, and
+# Peak Term ends on the Saturday of this week
+RULES = {
+    'Hilary': {'month': 1, 'day': 13, 'peak_week': 6},
+    'Trinity': {'month': 4, 'day': 20, 'peak_week': 5},
+    'Michaelmas': {'month': 10, 'day': 7, 'peak_week': 7},
+}
+# The terms in the order in which they fall in a year
+TERM_NAMES = list(RULES)
+# Terms that do not follow the rules, with the settings that they use instead
+OVERRIDES = {
+    # Torpids were rowed in 7th Week
+    ('2024', 'Hilary'): {'peak_week': 7},
+}
+# One week in nanoseconds
+WEEK = 7 * 24 * 3600 * 10**9
+HOUR = 3600 * 10**9
+
+
+def get_easter(year):
+    """Get the date of Easter Sunday (the anonymous Gregorian algorithm)."""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    ell = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * ell) // 451
+    month, day = divmod(h + ell - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def get_first_week_start(year, term_name):
+    """Get the first day (a Sunday) of 1st Week of a term."""
+    rule = RULES[term_name]
+    rule = {**rule, **OVERRIDES.get((str(year), term_name), {})}
+    if 'first_week_start' in rule:
+        return date.fromisoformat(rule['first_week_start'])
+    earliest = date(int(year), rule['month'], rule['day'])
+    # Monday is 0 and Sunday is 6
+    first_week_start = earliest + timedelta(days=(6 - earliest.weekday()) % 7)
+    if term_name == 'Trinity' and first_week_start == get_easter(int(year)):
+        # Full Term does not start on Easter Sunday
+        first_week_start += timedelta(weeks=1)
+    return first_week_start
+
+
+@lru_cache(maxsize=None)
+def get_term(year, term_name):
+    """Get the (year, term, start of 0th Week, end of Peak Term) of a term."""
+    rule = {**RULES[term_name], **OVERRIDES.get((str(year), term_name), {})}
+    noughth_start = get_first_week_start(year, term_name) - timedelta(weeks=1)
+    # Saturday of the week of the races
+    peak_term_end = noughth_start + timedelta(weeks=rule['peak_week'], days=6)
+    return (
+        str(year), term_name,
+        f'{noughth_start.isoformat()}T00:00:00Z',
+        f'{peak_term_end.isoformat()}T23:00:00Z',
+    )
+
+
+@lru_cache(maxsize=None)
+def _get_terms(first_year, last_year):
+    return tuple(
+        get_term(year, term_name)
+        for year in range(first_year, last_year + 1)
+        for term_name in TERM_NAMES
+    )
+
+
+def get_terms(first_year, last_year=None, until=None):
+    """
+    Get every term from the first to the last year, in order.
+
+    If `until` is given then only the terms whose 0th Week has started by then
+    are included (and `last_year` defaults to its year).
+    """
+    if last_year is None:
+        last_year = first_year if until is None else until.year
+    terms = _get_terms(int(first_year), int(last_year))
+    if until is not None:
+        until = pd.Timestamp(until)
+        terms = [t for t in terms if pd.Timestamp(t[2]) <= until]
+    return list(terms)
+
+
+@lru_cache(maxsize=None)
+def get_peak_term(term):
+    """Get the first and last hours of a term's Peak Term."""
+    # First day of 0th week
+    noughth_start = datetime.fromisoformat(term[2])
+    # Start of Peak Term
+    peak_term_start = noughth_start + timedelta(days=4)
+    # End of Peak Term
+    peak_term_end = datetime.fromisoformat(term[3])
+
+    return peak_term_start, peak_term_end
+
+
+def get_ninth_end(noughth_start):
+    """Get the last hour of 9th Week from the first day of 0th Week."""
+    return noughth_start + timedelta(weeks=10) - timedelta(hours=1)
+
+
+@lru_cache(maxsize=None)
+def _get_boundaries(terms):
+    noughth_starts = np.array(
+        [pd.Timestamp(term[2]).value for term in terms], dtype=np.int64
+    )
+    # 0th to 9th Week
+    ninth_ends = noughth_starts + 10 * WEEK - HOUR
+    return noughth_starts, ninth_ends
+
+
+def get_boundaries(terms):
+    """Get the starts of 0th Week and ends of 9th Week (in ns) of terms."""
+    return _get_boundaries(tuple(tuple(term) for term in terms))
+
+
+def locate(datetimes, terms):
+    """
+    Find the term, Oxford week, day of the week and hour of many times.
+
+    `terms` must be in order. Returns arrays of the index of the term in
+    `terms` (-1 for times outside 0th to 9th Week of every term), the week
+    number (0 for 0th Week), the day of the week (0 for Sunday) and the hour.
+    """
+    times = pd.DatetimeIndex(datetimes)
+    if times.tz is not None:
+        times = times.tz_convert('UTC').tz_localize(None)
+    times = times.to_numpy('datetime64[ns]').view(np.int64)
+    noughth_starts, ninth_ends = get_boundaries(terms)
+
+    # The latest term to have started by each time
+    term = np.searchsorted(noughth_starts, times, side='right') - 1
+    started = term >= 0
+    term = np.maximum(term, 0)
+    within = started & (times <= ninth_ends[term])
+    since_start = times - noughth_starts[term]
+    week = since_start // WEEK
+    # 0th Week starts on a Sunday
+    weekday = (since_start % WEEK) // (24 * HOUR)
+    hour = (times // HOUR) % 24
+
+    term = np.where(within, term, -1)
+    week = np.where(within, week, -1)
+    weekday = np.where(within, weekday, -1)
+
+    return term, week, weekday, hour
+
+
+if __name__ == '__main__':
+    # Print the terms of this year and the next
+    this_year = datetime.now().year
+    for term in get_terms(this_year, this_year + 1):
+        print(*term)